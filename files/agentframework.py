@@ -7,6 +7,9 @@ Created on Sat Sep 15 18:02:42 2018
 Description: The agent framework contains the three classes specifying the abilities of each agent (sheep and wolves)
 and how their are interacting with each other. 
 
+Class World: Context shared by all agents of a simulation (environment, herd, wolves and random number
+streams), so each agent holds a single reference instead of one per container.
+
 Class Sheep: Generates sheep agents and defines actions of each agent and interaction inbetween agents of the same class.
 Each sheep is moving across the field randomly, eating grass(the environment). Sheep who eat more
 than 100 units become sick and will sicken up. Sick sheep empty their stored environment at the current location. Sheep also
@@ -22,44 +25,133 @@ and randomly every iteration of the model. Wolfs who do not manage to catch a sh
 However, there is a 1% chance of a new wolf appearing.
 
 
-Class SheepPopControl: The third class of the agentframework contains control mechanisms to avoid the sheep population 
+Class Population: List of agents in which dead agents are removed and newborn agents are added
+in a single pass at the end of each iteration, so the herd and the wolves can be looped over safely.
+
+Class SheepPopControl: The last class of the agentframework contains control mechanisms to avoid the sheep population 
 growing exponentially. This includes two function, the first will randomly introduce new wolves while the second is reducing
 the sheep population through the introduction of a disease after the herd exceed a threshold. 
 
+Function catch_sheep: Predation from the wolves' side. Every wolf looks up the sheep near it in the
+spatial index of the herd, so the cost follows the number of sheep around the wolves rather than the
+number of sheep times the number of wolves. A sheep within reach of several wolves is caught by one.
+
+Function share_batched: Order-independent alternative to Sheep.share_with_neighbours. All sheep share
+at once: every pair of neighbours exchanges store towards the neighbourhood mean, computed from the
+stores before sharing, so the result does not depend on the order of the herd and the total store
+of the herd is conserved.
+
 """
 
 import random
 
+FEMALE = 1
+"""int: Flag bit of Sheep.flags set for female sheep."""
+REPRODUCE = 2
+"""int: Flag bit of Sheep.flags set for sheep that can mate."""
+
+
+class World:
+    """Context shared by all agents of a simulation.
+
+    Agents keep a reference to their world instead of separate references to the
+    environment, their population and their random number stream.
+
+    Args:
+        environment (Environment): Environment raster with running totals, see the raster module.
+        herd (Population): The sheep. A new empty Population if None.
+        wolves (Population): The wolves. A new empty Population if None.
+        sheep_rng (Random): Random number stream of the sheep. Defaults to the global random module.
+        wolf_rng (Random): Random number stream of the wolves. Defaults to the global random module.
+
+    Attributes:
+        height (int): Extent of the field along y, the number of rows of the environment raster.
+        width (int): Extent of the field along x, the number of columns of the environment raster.
+
+    """
+
+    __slots__ = ('environment', 'herd', 'wolves', 'sheep_rng', 'wolf_rng', 'height', 'width')
+
+    def __init__(self, environment, herd=None, wolves=None, sheep_rng=random, wolf_rng=random):
+        self.environment = environment
+        self.herd = Population() if herd is None else herd
+        self.wolves = Population() if wolves is None else wolves
+        self.sheep_rng = sheep_rng
+        self.wolf_rng = wolf_rng
+        self.height, self.width = environment.height, environment.width
+
+
 class Sheep:
     """Generate and define action for each sheep and the iteration of sheep within the herd.
     
-    Args:
-        environment (list): Nested list of integers. Each integer represent one pixel of the environment raster.
-        herd (dict): Dictionary containing all sheep, their location and attributes.
+    Sheep use __slots__, so they carry no attribute dictionary. Sex and fertility are bits of
+    a single integer and the original location is kept as two integers.
+
+    Arg:
+        world (World): World the sheep lives in.
         
     Attributes:
-        y (float): Randomly assigned initial value of y coordinate.
-        x (float): Randomly assigned initial value of x coordinate. 
-        environment (list): Environment raster, passed through from model.
+        y (int): Randomly assigned initial value of y coordinate.
+        x (int): Randomly assigned initial value of x coordinate. 
         store (int): Integer to store the amount of grass (environment) consumed by a sheep.
-        herd (dict): Dictionary containing all sheep, their location and attributes.
         alive (boolean): Status of sheep. By default, all sheep are alive when they are created.
-        sex (str): Randomly assigned sex, m = male, f= female. Each sheep has a 50% chance of being female.
-        reproduce (boolean): States whether sheep can mate. Only females can mate. By default
-        all females can mate at the start of the model.
+        flags (int): FEMALE and REPRODUCE bits. Each sheep has a 50% chance of being female. By
+        default all females can mate at the start of the model.
+        org_y, org_x (int): Coordinates of the sheep when it was created.
+        environment, herd, rng: The environment raster, the herd and the random number stream, from the world.
+        sex (str): m = male, f = female.
+        female (boolean): True for female sheep.
+        reproduce (boolean): States whether sheep can mate. Only females can mate.
             
     """
     
-    def __init__(self, environment,herd):
+    __slots__ = ('world', 'y', 'x', 'store', 'alive', 'flags', 'org_y', 'org_x')
+
+    def __init__(self, world):
         """Generate sheep."""
-        self.y = random.randint(0,99) 
-        self.x = random.randint(0,99)   
-        self.environment =  environment
+        rng = world.sheep_rng
+        self.world = world
+        self.y = self.org_y = rng.randint(0,world.height-1) 
+        self.x = self.org_x = rng.randint(0,world.width-1)   
         self.store = 0 
-        self.herd = herd
         self.alive = True
-        self.sex = 'm' if random.random() <0.5 else 'f'
-        self.reproduce = True if self.sex == 'f' else False
+        self.flags = 0 if rng.random() <0.5 else FEMALE | REPRODUCE
+
+    @property
+    def environment(self):
+        return self.world.environment
+
+    @property
+    def herd(self):
+        return self.world.herd
+
+    @property
+    def rng(self):
+        return self.world.sheep_rng
+
+    @property
+    def female(self):
+        return bool(self.flags & FEMALE)
+
+    @property
+    def sex(self):
+        return 'f' if self.flags & FEMALE else 'm'
+
+    @sex.setter
+    def sex(self, val):
+        self.flags = self.flags | FEMALE if val == 'f' else self.flags & ~FEMALE
+
+    @property
+    def reproduce(self):
+        return bool(self.flags & REPRODUCE)
+
+    @reproduce.setter
+    def reproduce(self, val):
+        self.flags = self.flags | REPRODUCE if val else self.flags & ~REPRODUCE
+
+    @property
+    def org_location(self):
+        return str(self.org_y) + '/' + str(self.org_x)
 
     """ Removed as code does not work properly with the animation.
 	
@@ -88,24 +180,12 @@ class Sheep:
     def __str__(self):
         """Override __str__ to print location.
         
-        Attributes:
-            org_location (str): Original x and y coordinates of the sheep.
+        return: Original location of the sheep as 'y/x'.
         
         """
         
-        try:
-            print(self.org_location)
-            """Try to print the location of the sheep."""
-        except:
-            """ store original location of agents.
-            
-            If the sheep's attribute which stores the original location has not been 
-            assigned, create the string variable and assign it the values of the x
-            and y coordinate and print the location.
-            
-            """
-            self.org_location =  str(self.y) + '/' + str(self.x)
-            print('y: ' + str(self.y) + ' x: ' + str(self.x))
+        print('y: ' + str(self.y) + ' x: ' + str(self.x))
+        return self.org_location
 
            
     def move(self):
@@ -113,11 +193,13 @@ class Sheep:
         
         Increment the x and y coordinate by 1 if the random number generated is greater 
         than 0.5. If the number is smaller than 0.5 subtract 1 from the current x or y 
-        coordinate.
+        coordinate. Sheep leaving the environment raster re-enter it on the opposite side.
         
         """
-        self.x = (self.x + 1) % 100 if random.random() < 0.5 else (self.x - 1) % 100
-        self.y = (self.y + 1) % 100 if random.random() < 0.5 else (self.y - 1) % 100
+        world = self.world
+        width, height, rng = world.width, world.height, world.sheep_rng
+        self.x = (self.x + 1) % width if rng.random() < 0.5 else (self.x - 1) % width
+        self.y = (self.y + 1) % height if rng.random() < 0.5 else (self.y - 1) % height
         
             
     def distance_between(sheep_a, sheep_b):
@@ -149,68 +231,63 @@ class Sheep:
         Sheep who ate 100 or more units become sick and empty their environment at the
         current location of the sheep.
         
+        Changes go through Environment.add so the remaining environment totals stay up to date.
+        
         """
         
-        if self.environment[self.y][self.x] > 10:
+        environment = self.world.environment
+        grass = environment[self.y][self.x]
+        if grass > 10:
             """If the environment is greater 10.""" 
-            self.environment[self.y][self.x] -= 10
+            environment.add(self.y, self.x, -10)
             """Subtract 10 from the environment."""
             self.store += 10
             """Add 10 to the sheep's store."""
         else:
             """If the environment is smaller 10."""
-            self.store += self.environment[self.y][self.x]
+            self.store += grass
             """Add the remaining environment to the sheep's store."""
-            self.environment[self.y][self.x] = 0
+            environment.add(self.y, self.x, -grass)
             """Set the environment to 0."""
         if self.store>100:
             """ if agents ate more than 100, sicken up."""
-            self.environment[self.y][self.x] += self.store
+            environment.add(self.y, self.x, self.store)
             """Add store to the environment."""
             self.store = 0
             """Reset store to 0."""
            
             
-    def share_with_neighbours(self,neighbourhood):
+    def share_with_neighbours(self,neighbourhood,grid=None):
         """Share environment with neighbours.
         
         Sheep within the user-defined neighbourhood share their store.
         
         arg: 
             neighbourhood (int): User-defined parameter, defining the distance within which sheep can share with each other.
+            grid (SpatialGrid): Optional spatial index of the herd. If given, only the sheep in the grid cells
+            around the sheep are checked instead of the whole herd. The neighbours are met in the order of
+            the candidates, so the grid needs the herd order as its key to give the same result as the
+            whole herd. Dead sheep, which the simulation removes from the grid, are skipped either way.
                 
         """
         
-        for sheep in self.herd:
-            if self.distance_between(sheep) <= neighbourhood:
-                """If sheep is within the neighbourhood equally divide their combined store."""
+        candidates = self.world.herd if grid is None else grid.query(self.x, self.y, neighbourhood)
+        found = 0
+        for sheep in candidates:
+            if sheep.alive and self.distance_between(sheep) <= neighbourhood:
+                """If sheep is alive and within the neighbourhood equally divide their combined store."""
                 average = (self.store + sheep.store ) / 2
                 self.store = average
                 sheep.store = average
+                found += 1
+        counts = self.world.herd.counts
+        if counts is not None:
+            """Count the interaction checks if the simulation is profiled."""
+            counts['share_with_neighbours_checks'] += len(candidates)
+            counts['share_with_neighbours_found'] += found
             
   
-    def escape_wolves(self,wolves):
-        """Try to escape wolf.
-        
-            Wolf can eat sheep within a radius of 5px. A sheep's probability of escaping the
-            wolf depends on it's fitness (i.e store). Sheep with a store above 80 units and sheep
-            are slow and will be caught by a wolf. Similarly, sheep with an empty store are weak
-            and also don't manage to escape the wolf. 
-
-            args:
-                wolves (dict): Dictionary of the location and attributes of all wolves.
-                
-        """
-        for wolf in wolves:
-            if (self.x - 2.5 <= wolf.x <= self.x + 2.5) and (self.y - 2.5 <= wolf.y <= self.y + 2.5):
-                """If sheep within 5px radius of a wolf check the sheep's store."""
-                if self.store == 0 or self.store>=80:
-                    """If the sheep's store is 0 or above 80 set set the alive status to false."""
-                    self.alive = False
-                    wolf.starving = 0
-                    """Reset the wolf's starving countdown."""
-
-    def mate(self):
+    def mate(self,grid=None):
         """Female sheep mate if meeting male sheep.
         
         If a female sheep is within a distance of 5px of a male sheep it will mate.
@@ -220,27 +297,37 @@ class Sheep:
         attr:
             mate (boolean): Indicates whether a sheep can mate. Is false by default.
         
+        arg:
+            grid (SpatialGrid): Optional spatial index of the herd. If given, only the sheep in the grid
+            cells around the sheep are checked instead of the whole herd.
+        
         return: True if sheep did mate.
         
         """
         
         mate = False
-        if self.reproduce:
+        if self.flags & REPRODUCE:
             """Evaluate if sheep is fertile."""
-            for sheep in self.herd:
+            candidates = self.world.herd if grid is None else grid.query(self.x, self.y, 5)
+            for sheep in candidates:
                 """Loop through the herd to find a male sheep within a distance of 5px."""
-                if sheep.sex == 'm' and  self.distance_between(sheep) <= 5:
+                if not sheep.flags & FEMALE and sheep.alive and self.distance_between(sheep) <= 5:
                     mate = True
                     """Change mating status to true."""
-                    self.reproduce = False
+                    self.flags &= ~REPRODUCE
                     """Change fertility status to false."""
                     break
                     """Break out of the loop as female sheep can only mate with one male per iteration."""
-        elif self.sex =='f':
+            counts = self.world.herd.counts
+            if counts is not None:
+                """Candidates are counted even if the search stopped early at a male."""
+                counts['mate_checks'] += len(candidates)
+                counts['mate_found'] += mate
+        elif self.flags & FEMALE:
             """If female sheep is infertile use a randomly generate number to evaluate if sheep becomes fertile."""
-            if random.random() <0.05:
+            if self.world.sheep_rng.random() <0.05:
                 """Sheep has a 5% chance of becoming fertile."""
-                self.reproduce = True
+                self.flags |= REPRODUCE
                 """Change fertility status to true."""
         return mate
 
@@ -248,24 +335,37 @@ class Sheep:
 class Wolf:
     """Generate and define action for each wolf.
 
+    Wolves use __slots__, like sheep.
+
     Arg:
-        wolves (dict): Dictionary containing all wolves and their attributes.
+        world (World): World the wolf lives in.
         
     Attributes:
         y (float): Randomly assigned initial value of y coordinate.
         x (float): Randomly assigned initial value of x coordinate. 
-        starving (int): Environment raster, passed through from model.
+        starving (int): Number of iterations since the wolf last caught a sheep.
         alive (boolean): Status of sheep. By default, all wolves are alive when they are created.
-        wolves (dict): Dictionary containing all wolves and their attributes.
+        wolves, rng: The wolves and their random number stream, from the world.
         
     """
     
-    def __init__(self,wolves):
-        self.y = random.randint(0,99) 
-        self.x = random.randint(0,99)
+    __slots__ = ('world', 'y', 'x', 'starving', 'alive')
+
+    def __init__(self,world):
+        rng = world.wolf_rng
+        self.world = world
+        self.y = rng.randint(0,world.height-1) 
+        self.x = rng.randint(0,world.width-1)
         self.starving = 0
         self.alive = True
-        self.wolves = wolves
+
+    @property
+    def wolves(self):
+        return self.world.wolves
+
+    @property
+    def rng(self):
+        return self.world.wolf_rng
         
     
     def hunt_sheep(self): 
@@ -280,8 +380,10 @@ class Wolf:
         
         """
         
-        self.x = (self.x + 2.5) % 100 if random.random() < 0.5 else (self.x - 2.5) % 100
-        self.y = (self.y + 2.5) % 100 if random.random() < 0.5 else (self.y - 2.5) % 100
+        world = self.world
+        width, height, rng = world.width, world.height, world.wolf_rng
+        self.x = (self.x + 2.5) % width if rng.random() < 0.5 else (self.x - 2.5) % width
+        self.y = (self.y + 2.5) % height if rng.random() < 0.5 else (self.y - 2.5) % height
         self.starving +=1
         
     def starve(self):
@@ -291,8 +393,59 @@ class Wolf:
             self.alive = False
             
             
+class Population(list):
+    """List of agents (sheep or wolves) with deferred removal of dead agents and buffered births.
+
+    Removing an agent from the middle of a list while looping over it shifts the remaining
+    agents, skips one of them and costs O(N) per removal. Instead, dead agents stay in the
+    population (with alive set to False) and newborn agents wait in a birth queue until
+    compact() is called at the end of an iteration. compact() rebuilds the list in place in a
+    single pass, so every agent holding a reference to the population keeps seeing the same list.
+
+    Arg:
+        agents (iterable): Initial agents.
+
+    Attributes:
+        births (list): Agents born since the last compaction.
+        counts (Counter): Interaction counters the sheep add to while the simulation is profiled. None otherwise.
+
+    """
+
+    counts = None
+
+    def __init__(self, agents=()):
+        super().__init__(agents)
+        self.births = []
+
+    def born(self, agent):
+        """Queue a newborn agent. It joins the population at the next compaction."""
+        self.births.append(agent)
+
+    def compact(self):
+        """Remove dead agents and add the queued newborns.
+
+        return: Number of agents removed and number of agents added.
+
+        """
+        size = len(self)
+        self[:] = [agent for agent in self if agent.alive]
+        removed = size - len(self)
+        added = len(self.births)
+        self.extend(self.births)
+        self.births.clear()
+        return removed, added
+
+
 class SheepPopControl():
-    """Introduces control mechanisms to prevent exponential growth of sheep population."""
+    """Introduces control mechanisms to prevent exponential growth of sheep population.
+    
+    Arg:
+        rng (Random): Random number stream of the population control. Defaults to the global random module.
+        
+    """
+    
+    def __init__(self,rng=random):
+        self.rng = rng
     
     def disease_outbreak(self,herd):
         """Prevent the sheep from growing exponentially by introducing diseases.
@@ -309,7 +462,7 @@ class SheepPopControl():
             """If herd size exceeds 100, introduce disease."""
             for i in herd:
                 """"Loop through each sheep in the herd."""
-                if random.random() <0.8:
+                if self.rng.random() <0.8:
                     """Each sheep has an 80% chance of dying."""
                     i.alive = False
                     """Change alive status to false for dying sheep."""
@@ -323,11 +476,86 @@ class SheepPopControl():
         
         """
         
-        if random.random() <0.01: return True
+        if self.rng.random() <0.01: return True
             
                     
                 
                 
         
         
-        
\ No newline at end of file
+        
+
+
+def share_batched(herd, neighbourhood, grid=None):
+    """Share environment with neighbours, all sheep at once.
+
+    Every sheep i receives from every neighbour j within the neighbourhood
+    (store_j - store_i) / (1 + max(degree_i, degree_j)), where the degree is the number of
+    neighbours of a sheep and every store is taken from before sharing. The exchange between
+    two sheep is symmetric, so the total store is conserved, and repeated sharing converges to
+    the mean store of each group of connected sheep. Two sheep with no other neighbours end up
+    with their average, like with share_with_neighbours.
+
+    args:
+        herd (list): Sheep of the herd. Dead sheep are ignored.
+        neighbourhood (int): Distance within which sheep share with each other.
+        grid (SpatialGrid): Optional spatial index of the live sheep. If given, only the sheep in the grid
+        cells around each sheep are checked instead of the whole herd.
+
+    """
+    live = [sheep for sheep in herd if sheep.alive]
+    index = {id(sheep): k for k, sheep in enumerate(live)}
+    neighbours, checks = [], 0
+    for sheep in live:
+        candidates = live if grid is None else grid.query(sheep.x, sheep.y, neighbourhood)
+        checks += len(candidates)
+        neighbours.append([index[id(other)] for other in candidates
+                           if other is not sheep and other.alive and sheep.distance_between(other) <= neighbourhood])
+    stores = [sheep.store for sheep in live]
+    degree = [len(near) for near in neighbours]
+    for k, sheep in enumerate(live):
+        sheep.store = stores[k] + sum((stores[m] - stores[k]) / (1 + max(degree[k], degree[m])) for m in neighbours[k])
+    counts = getattr(herd, 'counts', None)
+    if counts is not None:
+        counts['share_with_neighbours_checks'] += checks
+        counts['share_with_neighbours_found'] += sum(degree)
+
+
+def catch_sheep(wolves, grid):
+    """Let the wolves catch the weak sheep near them.
+
+    Every wolf looks up the sheep in the grid cells within 2.5px of it. Sheep within its
+    5px square are caught if their store is 0 or at least 80 units; stronger sheep escape.
+    A sheep within reach of several wolves is caught by the nearest one, or by the wolf
+    that comes first in the wolves on a tie, and only that wolf stops starving. Caught
+    sheep are marked dead and removed from the grid.
+
+    args:
+        wolves (list): The wolves.
+        grid (SpatialGrid): Spatial index of the live sheep.
+
+    return: Number of sheep caught.
+
+    """
+    catches = {}
+    checks = found = 0
+    for wolf in wolves:
+        candidates = grid.query(wolf.x, wolf.y, 2.5)
+        checks += len(candidates)
+        for sheep in candidates:
+            if abs(sheep.x - wolf.x) <= 2.5 and abs(sheep.y - wolf.y) <= 2.5:
+                found += 1
+                if sheep.store == 0 or sheep.store >= 80:
+                    distance = (sheep.x - wolf.x) ** 2 + (sheep.y - wolf.y) ** 2
+                    if id(sheep) not in catches or distance < catches[id(sheep)][0]:
+                        catches[id(sheep)] = (distance, wolf, sheep)
+    for distance, wolf, sheep in catches.values():
+        sheep.alive = False
+        wolf.starving = 0
+        """Reset the starving countdown of the wolf that caught the sheep."""
+        grid.remove(sheep)
+    counts = wolves[0].world.herd.counts if wolves else None
+    if counts is not None:
+        counts['catch_sheep_checks'] += checks
+        counts['catch_sheep_found'] += found
+    return len(catches)
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Array Framework
+
+Description: The array framework implements the rules of the agentframework on whole populations
+at once. Instead of one Python object per agent, the coordinates, stores and flags of all agents
+are kept in NumPy arrays (structure of arrays) and every behaviour is a handful of array
+operations over the full population.
+
+Class Herd: Stores the sheep and applies move, eat, share_with_neighbours (or the order-independent
+share_batched) and mate to all sheep at once. Dead sheep are removed by compact().
+
+Class Pack: Stores the wolves and applies hunt_sheep, catch_sheep and starve to all wolves at once.
+
+Class PopControl: Array version of SheepPopControl.
+
+Class SheepView and WolfView: Thin views exposing a single row of a Herd or Pack through the
+attributes of the agentframework's Sheep and Wolf classes (x, y, store, alive, sex, ...) so
+existing code that loops over agents keeps working. A view refers to a row index and is only
+valid until the next compact() of its population.
+
+Function sequential_average: Closed form of a store averaged with a list of stores one after the
+other, for one sheep or for several sheep at once.
+
+The environment is a raster.Environment, so the remaining environment totals stay up to date.
+
+"""
+
+import numpy as np
+import spatialindex as si
+
+
+class SheepView:
+    """Expose one sheep of a Herd with the attributes of agentframework.Sheep.
+
+    Args:
+        herd (Herd): Population the sheep belongs to.
+        i (int): Row of the sheep in the herd arrays.
+
+    """
+
+    __slots__ = ('herd', 'i')
+
+    def __init__(self, herd, i):
+        self.herd = herd
+        self.i = i
+
+    @property
+    def x(self):
+        return int(self.herd.x[self.i])
+
+    @x.setter
+    def x(self, val):
+        self.herd.x[self.i] = val
+
+    @property
+    def y(self):
+        return int(self.herd.y[self.i])
+
+    @y.setter
+    def y(self, val):
+        self.herd.y[self.i] = val
+
+    @property
+    def store(self):
+        return float(self.herd.store[self.i])
+
+    @store.setter
+    def store(self, val):
+        self.herd.store[self.i] = val
+
+    @property
+    def alive(self):
+        return bool(self.herd.alive[self.i])
+
+    @alive.setter
+    def alive(self, val):
+        self.herd.alive[self.i] = val
+
+    @property
+    def sex(self):
+        return 'f' if self.herd.female[self.i] else 'm'
+
+    @property
+    def reproduce(self):
+        return bool(self.herd.reproduce[self.i])
+
+    @reproduce.setter
+    def reproduce(self, val):
+        self.herd.reproduce[self.i] = val
+
+    @property
+    def org_location(self):
+        return str(self.herd.org_y[self.i]) + '/' + str(self.herd.org_x[self.i])
+
+    @property
+    def origin(self):
+        return int(self.herd.origin[self.i])
+
+    def __str__(self):
+        """Print the location of the sheep, like agentframework.Sheep."""
+        print('y: ' + str(self.y) + ' x: ' + str(self.x))
+        return self.org_location
+
+
+class WolfView:
+    """Expose one wolf of a Pack with the attributes of agentframework.Wolf.
+
+    Args:
+        pack (Pack): Population the wolf belongs to.
+        i (int): Row of the wolf in the pack arrays.
+
+    """
+
+    __slots__ = ('pack', 'i')
+
+    def __init__(self, pack, i):
+        self.pack = pack
+        self.i = i
+
+    @property
+    def x(self):
+        return float(self.pack.x[self.i])
+
+    @x.setter
+    def x(self, val):
+        self.pack.x[self.i] = val
+
+    @property
+    def y(self):
+        return float(self.pack.y[self.i])
+
+    @y.setter
+    def y(self, val):
+        self.pack.y[self.i] = val
+
+    @property
+    def starving(self):
+        return int(self.pack.starving[self.i])
+
+    @starving.setter
+    def starving(self, val):
+        self.pack.starving[self.i] = val
+
+    @property
+    def alive(self):
+        return bool(self.pack.alive[self.i])
+
+    @alive.setter
+    def alive(self, val):
+        self.pack.alive[self.i] = val
+
+
+class _Population:
+    """Shared storage logic of Herd and Pack.
+
+    Subclasses define the names and dtypes of their arrays in fields and the view class
+    returned when indexing the population.
+
+    """
+
+    fields = ()
+    view = None
+    counts = None
+    """Counter: Interaction counters added to while the simulation is profiled. None otherwise."""
+
+    def __init__(self, rng):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        for name, dtype in self.fields:
+            setattr(self, name, np.empty(0, dtype=dtype))
+
+    def __len__(self):
+        return len(self.alive)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError('population index out of range')
+        return self.view(self, i % len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.view(self, i)
+
+    def _append(self, **columns):
+        """Append rows to every array. Missing columns are filled with zeros."""
+        n = len(next(iter(columns.values())))
+        for name, dtype in self.fields:
+            column = columns.get(name, np.zeros(n, dtype=dtype))
+            setattr(self, name, np.concatenate((getattr(self, name), np.asarray(column, dtype=dtype))))
+
+    def _random(self, index=None):
+        """Draw one uniform random number in [0, 1) per agent.
+
+        arg:
+            index (ndarray): Rows of the agents. Every agent if None.
+
+        """
+        return self.rng.random(len(self) if index is None else len(index))
+
+    def compact(self):
+        """Remove dead agents from every array.
+
+        return: Number of agents removed.
+
+        """
+        keep = self.alive
+        removed = len(self) - int(keep.sum())
+        if removed:
+            for name, dtype in self.fields:
+                setattr(self, name, getattr(self, name)[keep])
+        return removed
+
+
+class Herd(_Population):
+    """Store the sheep in arrays and define the actions of the whole herd.
+
+    Args:
+        environment (Environment): Environment raster with running totals, see the raster module.
+        num_of_sheep (int): Number of sheep to generate.
+        rng (Generator): NumPy random generator. A fresh unseeded generator is used if None.
+
+    Attributes:
+        y, x (ndarray): Integer coordinates of each sheep.
+        store (ndarray): Amount of grass (environment) consumed by each sheep.
+        alive (ndarray): Status of each sheep.
+        female (ndarray): True for female sheep. Each sheep has a 50% chance of being female.
+        reproduce (ndarray): States whether sheep can mate. Only females can mate.
+        org_y, org_x (ndarray): Original coordinates of each sheep.
+        origin (ndarray): Position of each sheep in the starting herd, -1 for lambs. The herd is
+        compacted as sheep die, so this is how a sheep of the starting herd is found again.
+
+    """
+
+    fields = (('y', np.int64), ('x', np.int64), ('store', np.float64), ('alive', bool),
+              ('female', bool), ('reproduce', bool), ('org_y', np.int64), ('org_x', np.int64),
+              ('origin', np.int64))
+    view = SheepView
+
+    def __init__(self, environment, num_of_sheep=0, rng=None):
+        super().__init__(rng)
+        self.environment = environment
+        self.add(num_of_sheep)
+        self.origin = np.arange(len(self))
+
+    def add(self, n):
+        """Generate n sheep at random locations, like agentframework.Sheep."""
+        y = self.rng.integers(0, self.environment.height, n)
+        x = self.rng.integers(0, self.environment.width, n)
+        female = self.rng.random(n) >= 0.5
+        self._append(y=y, x=x, alive=np.ones(n, dtype=bool), female=female,
+                     reproduce=female, org_y=y, org_x=x, origin=np.full(n, -1))
+
+    def move(self):
+        """Move every sheep one pixel in a random direction along x and y, wrapping around the raster."""
+        self.x = (self.x + np.where(self._random() < 0.5, 1, -1)) % self.environment.width
+        self.y = (self.y + np.where(self._random() < 0.5, 1, -1)) % self.environment.height
+
+    def eat(self, order=None):
+        """Sheep eat the environment.
+
+        Every sheep eats 10 units, or the remaining environment if less than 10 units are
+        left, at its current location. Sheep sharing a pixel eat in turn, so the n-th
+        sheep on a pixel gets what the previous ones left over. Sheep who ate more than 100
+        units afterwards sicken up and empty their store at their location.
+
+        arg:
+            order (ndarray): Permutation of the herd giving the order in which sheep eat. Herd order if None.
+
+        """
+        env = self.environment
+        cell = self.y * env.width + self.x
+        order = np.arange(len(cell)) if order is None else order
+        order = order[np.argsort(cell[order], kind='stable')]
+        sorted_cell = cell[order]
+        first = np.flatnonzero(np.r_[True, sorted_cell[1:] != sorted_cell[:-1]])
+        rank = np.empty(len(cell), dtype=np.int64)
+        rank[order] = np.arange(len(cell)) - np.repeat(first, np.diff(np.r_[first, len(cell)]))
+
+        grass = env.get_at(self.y, self.x)
+        eaten = np.clip(grass - 10 * rank, 0, 10)
+        env.add_at(self.y, self.x, -eaten)
+        self.store += eaten
+
+        sick = self.store > 100
+        env.add_at(self.y[sick], self.x[sick], self.store[sick])
+        self.store[sick] = 0
+
+    def _neighbours(self, neighbourhood):
+        """Find every pair of sheep within the neighbourhood of each other, with the spatial index.
+
+        arg:
+            neighbourhood (int): Distance within which sheep can share with each other.
+
+        return: Rows i and j of the sheep of every pair, both ways round.
+
+        """
+        x, y = self.x, self.y
+        i, j = si.candidate_pairs(x, y, x, y, neighbourhood, self.environment.width, self.environment.height)
+        near = (i != j) & ((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 <= neighbourhood ** 2)
+        if self.counts is not None:
+            self.counts['share_with_neighbours_checks'] += len(i)
+            self.counts['share_with_neighbours_found'] += int(near.sum())
+        i, j = i[near], j[near]
+        return i, j
+
+    def share_with_neighbours(self, neighbourhood, order=None):
+        """Share environment with neighbours.
+
+        Sheep are processed one after the other. Each sheep in turn averages its store
+        with every other sheep within the neighbourhood, taken in the same order, exactly
+        like agentframework.Sheep.share_with_neighbours. Neighbours are found once for the
+        whole herd with the spatial index.
+
+        args:
+            neighbourhood (int): Distance within which sheep can share with each other.
+            order (ndarray): Permutation of the herd giving the order in which sheep share. Herd order if None.
+
+        """
+        store = self.store
+        order = np.arange(len(self)) if order is None else order
+        rank = np.empty(len(self), dtype=np.int64)
+        rank[order] = np.arange(len(self))
+        i, j = self._neighbours(neighbourhood)
+        by_rank = np.lexsort((rank[j], i))
+        i, j = i[by_rank], j[by_rank]
+        bounds = np.searchsorted(i, np.arange(len(self) + 1))
+        for k in order[np.diff(bounds)[order] > 0]:
+            near = j[bounds[k]:bounds[k + 1]]
+            store[k], store[near] = sequential_average(store[k], store[near])
+
+    def share_batched(self, neighbourhood):
+        """Share environment with neighbours, all sheep at once.
+
+        Order-independent sharing, like agentframework.share_batched: every sheep receives
+        (store_j - store_i) / (1 + max(degree_i, degree_j)) from every neighbour j, computed
+        from the stores before sharing. The exchange is symmetric, so the total store is
+        conserved, and the whole herd is handled in one pass over the neighbour pairs.
+
+        arg:
+            neighbourhood (int): Distance within which sheep can share with each other.
+
+        """
+        store = self.store
+        i, j = self._neighbours(neighbourhood)
+        degree = np.bincount(i, minlength=len(self))
+        flow = (store[j] - store[i]) / (1 + np.maximum(degree[i], degree[j]))
+        self.store = store + np.bincount(i, weights=flow, minlength=len(self))
+
+    def mate(self):
+        """Female sheep mate if meeting male sheep.
+
+        Fertile females with a male sheep within a distance of 5px mate and become
+        infertile. Infertile females have a 5% chance of becoming fertile again.
+
+        return: Number of sheep born.
+
+        """
+        fertile = np.flatnonzero(self.reproduce & self.alive)
+        infertile = np.flatnonzero(self.female & ~self.reproduce & self.alive)
+        males = np.flatnonzero(~self.female & self.alive)
+        mated = np.zeros(len(fertile), dtype=bool)
+        if len(fertile) and len(males):
+            i, j = si.candidate_pairs(self.x[fertile], self.y[fertile], self.x[males], self.y[males], 5,
+                                      self.environment.width, self.environment.height)
+            near = (self.x[fertile[i]] - self.x[males[j]]) ** 2 + (self.y[fertile[i]] - self.y[males[j]]) ** 2 <= 25
+            mated[i[near]] = True
+            if self.counts is not None:
+                self.counts['mate_checks'] += len(i)
+                self.counts['mate_found'] += int(near.sum())
+        self.reproduce[fertile[mated]] = False
+        self.reproduce[infertile[self._random(infertile) < 0.05]] = True
+        return int(mated.sum())
+
+
+class Pack(_Population):
+    """Store the wolves in arrays and define the actions of all wolves.
+
+    Args:
+        num_of_wolves (int): Number of wolves to generate.
+        rng (Generator): NumPy random generator. A fresh unseeded generator is used if None.
+        height (int): Extent of the field along y.
+        width (int): Extent of the field along x.
+
+    Attributes:
+        y, x (ndarray): Coordinates of each wolf.
+        starving (ndarray): Number of iterations since each wolf last caught a sheep.
+        alive (ndarray): Status of each wolf.
+
+    """
+
+    fields = (('y', np.float64), ('x', np.float64), ('starving', np.int64), ('alive', bool))
+    view = WolfView
+
+    def __init__(self, num_of_wolves=0, rng=None, height=100, width=100):
+        super().__init__(rng)
+        self.height = height
+        self.width = width
+        self.add(num_of_wolves)
+
+    def add(self, n):
+        """Generate n wolves at random locations, like agentframework.Wolf."""
+        self._append(y=self.rng.integers(0, self.height, n), x=self.rng.integers(0, self.width, n),
+                     alive=np.ones(n, dtype=bool))
+
+    def hunt_sheep(self):
+        """Move every wolf 2.5px in a random direction along x and y and increase its risk of starving."""
+        self.x = (self.x + np.where(self._random() < 0.5, 2.5, -2.5)) % self.width
+        self.y = (self.y + np.where(self._random() < 0.5, 2.5, -2.5)) % self.height
+        self.starving += 1
+
+    def catch_sheep(self, herd):
+        """Catch the weak sheep near the wolves.
+
+        Like agentframework.catch_sheep: every wolf looks up the sheep in the grid cells
+        within 2.5px of it, and catches the sheep in its 5px square whose store is 0 or at
+        least 80 units. A sheep within reach of several wolves is caught by the nearest one,
+        or the first of the pack on a tie, and only that wolf stops starving.
+
+        arg:
+            herd (Herd): The sheep. Caught sheep are marked dead.
+
+        return: Number of sheep caught.
+
+        """
+        weak = np.flatnonzero(herd.alive & ((herd.store == 0) | (herd.store >= 80)))
+        if not len(weak) or not len(self):
+            return 0
+        i, j = si.candidate_pairs(self.x, self.y, herd.x[weak], herd.y[weak], 2.5,
+                                  herd.environment.width, herd.environment.height)
+        dx, dy = herd.x[weak[j]] - self.x[i], herd.y[weak[j]] - self.y[i]
+        near = (np.abs(dx) <= 2.5) & (np.abs(dy) <= 2.5)
+        if herd.counts is not None:
+            herd.counts['catch_sheep_checks'] += len(i)
+            herd.counts['catch_sheep_found'] += int(near.sum())
+        i, j, distance = i[near], j[near], (dx[near] ** 2 + dy[near] ** 2)
+        first = np.lexsort((i, distance, j))
+        """Sort by sheep, then distance, then wolf, so the first pair of each sheep is its catch."""
+        i, j = i[first], j[first]
+        catch = np.ones(len(j), dtype=bool)
+        catch[1:] = j[1:] != j[:-1]
+        herd.alive[weak[j[catch]]] = False
+        self.starving[i[catch]] = 0
+        return int(catch.sum())
+
+    def starve(self):
+        """Wolves who do not catch a sheep for 100 iterations will starve."""
+        self.alive &= self.starving < 100
+
+
+class PopControl:
+    """Control mechanisms to prevent exponential growth of a Herd.
+
+    Args:
+        rng (Generator): NumPy random generator. A fresh unseeded generator is used if None.
+
+    """
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def disease_outbreak(self, herd):
+        """If the herd exceeds 100 sheep, each sheep has an 80% chance of dying."""
+        if len(herd) > 100:
+            herd.alive &= self.rng.random(len(herd)) >= 0.8
+
+    def new_wolves(self):
+        """return: True if a new wolf is being introduced (1% chance)."""
+        return self.rng.random() < 0.01
+
+
+def sequential_average(a, b, block=512):
+    """Average a store with each store in b in turn.
+
+    Averaging a with b_1, then the result with b_2 and so on gives after t pairs
+    a_t = (a + sum(b_m * 2^(m-1) for m <= t)) / 2^t. The sum is evaluated with cumsum in
+    blocks small enough for the powers of two to stay within floating point range.
+
+    args:
+        a (float or ndarray): Store of the sharing sheep, or of several sheep sharing at once.
+        b (ndarray): Stores of the neighbours, in sharing order along the last axis. One row
+        per sheep if a is an array.
+
+    return: The store of the sharing sheep after the last neighbour and the new stores of
+    the neighbours.
+
+    """
+    a = np.asarray(a, dtype=float)
+    out = np.empty(np.shape(b))
+    for start in range(0, out.shape[-1], block):
+        part = b[..., start:start + block]
+        power = 2.0 ** np.arange(part.shape[-1])
+        out[..., start:start + part.shape[-1]] = (a[..., None] + np.cumsum(part * power, axis=-1)) / (2 * power)
+        a = out[..., start + part.shape[-1] - 1]
+    return a, out
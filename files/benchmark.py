@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Benchmark
+
+Description: Measures the time and memory spent in parts of the model.
+
+Function compare_reordering: Compares the former way of randomising the order of the agents
+(every sheep drawing its own shuffled copy of the herd with random.sample) with the single
+in-place shuffle per iteration shared by all agents, for several herd sizes.
+
+Function world_scaling: Measures the time of a model iteration of the array backend on uniform
+fields of increasing size, at a fixed number of sheep and at a fixed density of sheep.
+
+Function suite: Times the hot paths of the agents (Sheep.move, eat, share_with_neighbours,
+mate, Wolf.hunt_sheep, catch_sheep) and a full iteration of both backends, with fixed seeds,
+for every combination of herd size, number of wolves, neighbourhood and raster size. The
+results, together with the scaling exponent of every phase (the slope of log time over log herd
+size), are saved as JSON, and compare() lists the measurements that got slower than a previous
+run, so regressions are caught between versions.
+
+The benchmarks can be run from the command line:
+
+	python benchmark.py
+	python benchmark.py suite out=benchmark.json baseline=previous.json
+
+"""
+
+import itertools
+import json
+import math
+import platform
+import random as rnd
+import sys
+import time
+import tracemalloc
+import numpy as np
+import agentframework as af
+import raster
+import simulation as sm
+import spatialindex as si
+
+PHASES = ('move', 'eat', 'share_with_neighbours', 'catch_sheep', 'mate', 'hunt_sheep', 'step')
+"""tuple: Phases timed by the suite. step is a full iteration of the simulation."""
+
+
+def measure(function, *args, repeat=10):
+    """Measure the time and the memory allocated by a function.
+
+    args:
+        function (callable): Function to measure.
+        args: Arguments passed to the function.
+        repeat (int): Number of calls.
+
+    return: Mean time per call in seconds and peak memory allocated by a single call in bytes.
+
+    """
+    start = time.perf_counter()
+    for i in range(repeat):
+        function(*args)
+    seconds = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def reorder_per_agent(herd):
+    """Former reordering: every sheep holds its own shuffled copy of the herd."""
+    return [rnd.sample(herd, k=len(herd)) for sheep in herd]
+
+
+def reorder_shared(herd):
+    """Current reordering: one in-place shuffle of the herd shared by all sheep."""
+    rnd.shuffle(herd)
+
+
+def compare_reordering(sizes=(10, 100, 1000), repeat=5, seed=0):
+    """Compare the per-agent and the shared reordering of the herd.
+
+    args:
+        sizes (tuple): Herd sizes to measure.
+        repeat (int): Number of iterations measured per size.
+        seed (int): Seed of the random module.
+
+    return: List of dictionaries with the herd size, time per iteration and peak memory of both reorderings.
+
+    """
+    rnd.seed(seed)
+    world = af.World(raster.Environment(np.zeros((100, 100))))
+    results = []
+    for size in sizes:
+        row = {'sheep': size}
+        for name, function in (('per_agent', reorder_per_agent), ('shared', reorder_shared)):
+            herd = []
+            for i in range(size):
+                herd.append(af.Sheep(world))
+            row[name + '_seconds'], row[name + '_bytes'] = measure(function, herd, repeat=repeat)
+        results.append(row)
+    return results
+
+
+def world_scaling(sizes=(100, 300, 1000, 3000), sheep=1000, density=0.01, repeat=5, seed=0):
+    """Measure how the time of an iteration scales with the size of the field.
+
+    args:
+        sizes (tuple): Side lengths of the square fields to measure.
+        sheep (int): Number of sheep of the fixed-count runs.
+        density (float): Sheep per cell of the fixed-density runs.
+        repeat (int): Number of iterations measured per run.
+        seed (int): Seed of the simulations.
+
+    return: List of dictionaries with the side length, time per iteration and peak memory at fixed count and at fixed density.
+
+    """
+    results = []
+    for size in sizes:
+        row = {'size': size}
+        for name, n in (('count', sheep), ('density', int(density * size * size))):
+            field = np.full((size, size), 100.0)
+            simulation = sm.VectorSimulation(field, num_of_sheep=n, num_of_wolves=max(1, n // 50), seed=seed)
+            row[name + '_sheep'] = n
+            row[name + '_seconds'], row[name + '_bytes'] = measure(simulation.step, repeat=repeat)
+        results.append(row)
+    return results
+
+
+def phases(simulation):
+    """Define one call of every phase of a simulation on its whole herd or pack.
+
+    The phases act on the current state, as they would inside an iteration, but dead
+    sheep are not removed and lambs are not added, so the population stays the same
+    while a phase is measured repeatedly.
+
+    arg:
+        simulation (Simulation or VectorSimulation): Simulation to be measured.
+
+    return: Dictionary of phase name to a callable without arguments.
+
+    """
+    herd, wolves, neighbourhood = simulation.herd, simulation.wolves, simulation.neighbourhood
+    if isinstance(simulation, sm.VectorSimulation):
+        order = np.arange(len(herd))
+        return {'move': herd.move,
+                'eat': lambda: herd.eat(order),
+                'share_with_neighbours': lambda: herd.share_with_neighbours(neighbourhood, order),
+                'catch_sheep': lambda: wolves.catch_sheep(herd),
+                'mate': herd.mate,
+                'hunt_sheep': wolves.hunt_sheep,
+                'step': simulation.step}
+    width, height = simulation.environment.width, simulation.environment.height
+
+    def share():
+        grid = si.SpatialGrid(5, width, height, herd, key={sheep: i for i, sheep in enumerate(herd)}.__getitem__)
+        for sheep in herd:
+            sheep.share_with_neighbours(neighbourhood, grid)
+
+    def catch():
+        af.catch_sheep(wolves, si.SpatialGrid(5, width, height, [sheep for sheep in herd if sheep.alive]))
+
+    def mate():
+        grid = si.SpatialGrid(5, width, height, herd)
+        for sheep in herd:
+            sheep.mate(grid)
+
+    return {'move': lambda: [sheep.move() for sheep in herd],
+            'eat': lambda: [sheep.eat() for sheep in herd],
+            'share_with_neighbours': share,
+            'catch_sheep': catch,
+            'mate': mate,
+            'hunt_sheep': lambda: [wolf.hunt_sheep() for wolf in wolves],
+            'step': simulation.step}
+
+
+def scaling_exponents(results):
+    """Fit how the time of every phase grows with the size of the herd.
+
+    arg:
+        results (list): Measurements returned by suite.
+
+    return: List of dictionaries with the backend, phase, wolves, neighbourhood, raster size and
+    the exponent k of time ~ sheep ** k, for every series measured at two or more herd sizes.
+
+    """
+    series = {}
+    for row in results:
+        key = (row['backend'], row['phase'], row['wolves'], row['neighbourhood'], row['size'])
+        series.setdefault(key, []).append((row['sheep'], row['seconds']))
+    exponents = []
+    for (backend, phase, wolves, neighbourhood, size), points in sorted(series.items()):
+        if len(points) < 2:
+            continue
+        sheep, seconds = np.log(np.array(points, dtype=float)).T
+        exponents.append({'backend': backend, 'phase': phase, 'wolves': wolves, 'neighbourhood': neighbourhood,
+                          'size': size, 'exponent': float(np.polyfit(sheep, seconds, 1)[0])})
+    return exponents
+
+
+def suite(sheep=(10, 100, 1000, 10000, 100000), wolves=(2, 20), neighbourhoods=(5, 20), sizes=(300, 1000),
+          backends=('objects', 'arrays'), max_objects=10000, max_pairs=2e7, repeat=3, seed=0):
+    """Time every phase of both backends for every combination of the parameters.
+
+    Each combination starts from a new simulation on a uniform raster with the same seed, so
+    repeated runs measure the same work.
+
+    args:
+        sheep (tuple): Herd sizes.
+        wolves (tuple): Numbers of wolves.
+        neighbourhoods (tuple): Sizes of the neighbourhood in which sheep share.
+        sizes (tuple): Side lengths of the square rasters.
+        backends (tuple): 'objects' (Simulation) and/or 'arrays' (VectorSimulation).
+        max_objects (int): Largest herd measured on the object backend, which is too slow for the largest herds.
+        max_pairs (float): Largest expected number of pairs of sheep within the neighbourhood. Denser
+        combinations are skipped, as the sharing of the array backend holds every pair in memory.
+        repeat (int): Number of calls measured per phase.
+        seed (int): Seed of the simulations.
+
+    return: Dictionary with the environment of the run, the measurements (time per call in seconds
+    and peak memory allocated by a call in bytes), the skipped combinations and the scaling exponents.
+
+    """
+    results, skipped = [], []
+    for backend, n, w, neighbourhood, size in itertools.product(backends, sheep, wolves, neighbourhoods, sizes):
+        pairs = n * n * min(1.0, math.pi * neighbourhood ** 2 / size ** 2)
+        if (backend == 'objects' and n > max_objects) or pairs > max_pairs:
+            skipped.append({'backend': backend, 'sheep': n, 'wolves': w, 'neighbourhood': neighbourhood, 'size': size})
+            continue
+        cls = sm.VectorSimulation if backend == 'arrays' else sm.Simulation
+        for phase in PHASES:
+            simulation = cls(np.full((size, size), 100.0), num_of_sheep=n, num_of_wolves=w,
+                             neighbourhood=neighbourhood, seed=seed)
+            seconds, peak = measure(phases(simulation)[phase], repeat=repeat)
+            results.append({'backend': backend, 'phase': phase, 'sheep': n, 'wolves': w,
+                            'neighbourhood': neighbourhood, 'size': size, 'seconds': seconds, 'bytes': peak})
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'seed': seed, 'repeat': repeat, 'results': results, 'skipped': skipped,
+            'exponents': scaling_exponents(results)}
+
+
+def save(report, path):
+    """Write a report returned by suite to a JSON file."""
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=1)
+
+
+def compare(baseline, report, tolerance=1.25):
+    """Find the measurements that got slower.
+
+    args:
+        baseline (dict): Earlier report, as returned by suite or read from its JSON file.
+        report (dict): Current report.
+        tolerance (float): Ratio of current to baseline time above which a measurement counts as slower.
+
+    return: List of the slower measurements, each with the baseline time and the ratio added.
+
+    """
+    def key(row):
+        return row['backend'], row['phase'], row['sheep'], row['wolves'], row['neighbourhood'], row['size']
+
+    before = {key(row): row['seconds'] for row in baseline['results']}
+    slower = []
+    for row in report['results']:
+        if key(row) in before and row['seconds'] > tolerance * before[key(row)]:
+            slower.append(dict(row, baseline_seconds=before[key(row)], ratio=row['seconds'] / before[key(row)]))
+    return slower
+
+
+if __name__ == '__main__' and 'suite' in sys.argv:
+    options = dict(i.split('=', 1) for i in sys.argv[1:] if '=' in i)
+    report = suite()
+    save(report, options.get('out', 'benchmark.json'))
+    print('{:>8} {:>22} {:>8} {:>8} {:>14}'.format('backend', 'phase', 'wolves', 'nbhood', 'exponent'))
+    for row in report['exponents']:
+        if row['size'] == 300:
+            print('{backend:>8} {phase:>22} {wolves:>8} {neighbourhood:>8} {exponent:>14.2f}'.format(**row))
+    if 'baseline' in options:
+        with open(options['baseline']) as file:
+            slower = compare(json.load(file), report)
+        for row in slower:
+            print('Slower: {backend} {phase} sheep={sheep} wolves={wolves} neighbourhood={neighbourhood} '
+                  'size={size}: {ratio:.2f}x'.format(**row))
+        sys.exit(1 if slower else 0)
+elif __name__ == '__main__':
+    print('{:>8} {:>14} {:>14} {:>14} {:>14}'.format('sheep', 'per agent (s)', 'shared (s)',
+                                                     'per agent (B)', 'shared (B)'))
+    for row in compare_reordering():
+        print('{sheep:>8} {per_agent_seconds:>14.6f} {shared_seconds:>14.6f} '
+              '{per_agent_bytes:>14} {shared_bytes:>14}'.format(**row))
+    print()
+    print('{:>6} {:>10} {:>14} {:>10} {:>14}'.format('size', 'sheep', 'count (s)', 'sheep', 'density (s)'))
+    for row in world_scaling():
+        print('{size:>6} {count_sheep:>10} {count_seconds:>14.6f} {density_sheep:>10} '
+              '{density_seconds:>14.6f}'.format(**row))
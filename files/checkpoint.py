@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Checkpoint
+
+Description: Saves the complete state of a simulation (environment raster and its running sums,
+every attribute of every sheep and wolf, the state of all random number streams, the model
+parameters and the iteration counters) to a compressed NumPy archive, and restores it. The
+raster is saved next to the archive as its own .npy file, copied a band of rows at a time both
+ways, so rasters larger than memory can be checkpointed and restored into a TiledEnvironment. A
+restored simulation continues exactly as the original would have, so long runs survive being
+interrupted, and many scenarios can be branched from one warmed-up state by overriding the
+parameters or the seed when loading.
+
+Works with both Simulation (object backend) and VectorSimulation (array backend).
+
+Class Checkpointer: Subscribes to a simulation and saves a checkpoint at a fixed interval of
+model updates, keeping only the most recent ones.
+
+"""
+
+import glob
+import json
+import os
+import numpy as np
+import agentframework as af
+import raster
+import simulation as sm
+
+BAND = 256
+"""int: Number of raster rows copied at a time when saving or restoring the raster."""
+
+PARAMETERS = ('num_of_iterations', 'neighbourhood', 'max_iterations', 'regrowth', 'spread', 'capacity', 'share')
+"""tuple: Model parameters stored in a checkpoint and accepted as overrides by load."""
+
+
+def raster_path(path):
+    """return: Path of the .npy file holding the raster of the checkpoint saved at path."""
+    return os.path.splitext(path)[0] + '.raster.npy'
+
+
+def _herd_arrays(simulation):
+    """return: Dictionary of arrays describing every sheep and every wolf."""
+    herd, wolves = simulation.herd, simulation.wolves
+    if isinstance(simulation, sm.VectorSimulation):
+        arrays = {'sheep_' + name: getattr(herd, name) for name, dtype in herd.fields}
+        arrays.update({'wolf_' + name: getattr(wolves, name) for name, dtype in wolves.fields})
+        return arrays
+    return {'sheep_y': np.array([s.y for s in herd], dtype=np.int64),
+            'sheep_x': np.array([s.x for s in herd], dtype=np.int64),
+            'sheep_store': np.array([s.store for s in herd], dtype=float),
+            'sheep_alive': np.array([s.alive for s in herd], dtype=bool),
+            'sheep_female': np.array([s.female for s in herd], dtype=bool),
+            'sheep_reproduce': np.array([s.reproduce for s in herd], dtype=bool),
+            'sheep_org_y': np.array([s.org_y for s in herd], dtype=np.int64),
+            'sheep_org_x': np.array([s.org_x for s in herd], dtype=np.int64),
+            'wolf_y': np.array([w.y for w in wolves], dtype=float),
+            'wolf_x': np.array([w.x for w in wolves], dtype=float),
+            'wolf_starving': np.array([w.starving for w in wolves], dtype=np.int64),
+            'wolf_alive': np.array([w.alive for w in wolves], dtype=bool)}
+
+
+def save(simulation, path):
+    """Save the state of a simulation.
+
+    The files are written under temporary names and renamed, the raster first, so an
+    interrupted save never leaves a truncated checkpoint behind.
+
+    args:
+        simulation (Simulation): Simulation to be saved.
+        path (str): Path of the checkpoint file (.npz). The raster goes to raster_path(path).
+
+    """
+    environment = simulation.environment
+    state = {'backend': 'arrays' if isinstance(simulation, sm.VectorSimulation) else 'objects',
+             'parameters': {name: getattr(simulation, name) for name in PARAMETERS},
+             'steps': simulation.steps, 'updates': simulation.updates,
+             'extinction_step': simulation.extinction_step, 'events': simulation.events,
+             'total': environment.total, 'rng': simulation.rng.getstate()}
+    values = np.asarray(environment)
+    temporary = raster_path(path) + '.tmp'
+    copy = np.lib.format.open_memmap(temporary, mode='w+', dtype=float, shape=values.shape)
+    for start in range(0, values.shape[0], BAND):
+        copy[start:start + BAND] = values[start:start + BAND]
+    copy.flush()
+    del copy
+    os.replace(temporary, raster_path(path))
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez_compressed(file, row_sums=environment.row_sums, state=np.array(json.dumps(state)),
+                            **_herd_arrays(simulation))
+    os.replace(temporary, path)
+
+
+def load(path, tiled=None, **overrides):
+    """Restore a simulation from a checkpoint.
+
+    args:
+        path (str): Path of the checkpoint file.
+        tiled (str): Path of a working file to restore the environment into a TiledEnvironment,
+        for rasters larger than memory. If None the environment is restored into memory.
+        overrides: New values for the parameters listed in PARAMETERS, and seed.
+        Passing a seed replaces the saved random number streams, to branch a new scenario
+        from the saved state.
+
+    return: Simulation or VectorSimulation, as saved.
+
+    """
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    values = np.load(raster_path(path), mmap_mode='r')
+    """memmap: Saved raster, read a band at a time by the environment it is restored into."""
+    state = json.loads(str(arrays.pop('state')))
+    parameters = dict(state['parameters'])
+    parameters.update({name: value for name, value in overrides.items() if name in PARAMETERS})
+
+    vectorized = state['backend'] == 'arrays'
+    cls = sm.VectorSimulation if vectorized else sm.Simulation
+    environment = values if tiled is None else raster.TiledEnvironment(tiled, values)
+    simulation = cls(environment, num_of_sheep=0, num_of_wolves=0, seed=overrides.get('seed'), **parameters)
+    simulation.environment.row_sums = arrays['row_sums']
+    simulation.environment.total = state['total']
+
+    sheep = {name[6:]: column for name, column in arrays.items() if name.startswith('sheep_')}
+    wolf = {name[5:]: column for name, column in arrays.items() if name.startswith('wolf_')}
+    if vectorized:
+        for name, column in sheep.items():
+            setattr(simulation.herd, name, column)
+        for name, column in wolf.items():
+            setattr(simulation.wolves, name, column)
+    else:
+        for i in range(len(sheep['x'])):
+            s = af.Sheep(simulation.world)
+            s.y, s.x = int(sheep['y'][i]), int(sheep['x'][i])
+            s.store, s.alive = float(sheep['store'][i]), bool(sheep['alive'][i])
+            s.flags = af.FEMALE * bool(sheep['female'][i]) | af.REPRODUCE * bool(sheep['reproduce'][i])
+            s.org_y, s.org_x = int(sheep['org_y'][i]), int(sheep['org_x'][i])
+            simulation.herd.append(s)
+        for i in range(len(wolf['x'])):
+            w = af.Wolf(simulation.world)
+            w.y, w.x = float(wolf['y'][i]), float(wolf['x'][i])
+            w.starving, w.alive = int(wolf['starving'][i]), bool(wolf['alive'][i])
+            simulation.wolves.append(w)
+
+    if overrides.get('seed') is None:
+        simulation.rng.setstate(state['rng'])
+    simulation.steps, simulation.updates = state['steps'], state['updates']
+    simulation.extinction_step, simulation.events = state['extinction_step'], state['events']
+    return simulation
+
+
+def latest(directory):
+    """return: Path of the most recent checkpoint in a directory, or None."""
+    paths = sorted(glob.glob(os.path.join(directory, 'checkpoint_*.npz')))
+    return paths[-1] if paths else None
+
+
+class Checkpointer:
+    """Save checkpoints of a simulation at a fixed interval.
+
+    Args:
+        simulation (Simulation): Simulation to be saved. The checkpointer subscribes to it.
+        directory (str): Directory of the checkpoints. Created if missing.
+        every (int): Number of model updates between checkpoints. Checkpoints are only taken
+        between model updates, so a restored simulation resumes at the start of an update.
+        keep (int): Number of most recent checkpoints kept on disk.
+
+    """
+
+    def __init__(self, simulation, directory, every=10, keep=2):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        simulation.subscribe(self.checkpoint)
+
+    def checkpoint(self, simulation):
+        """Save a checkpoint if the model update is a multiple of the interval."""
+        if simulation.updates % self.every:
+            return
+        save(simulation, os.path.join(self.directory, 'checkpoint_{:010d}.npz'.format(simulation.steps)))
+        for path in sorted(glob.glob(os.path.join(self.directory, 'checkpoint_*.npz')))[:-self.keep]:
+            os.remove(path)
+            os.remove(raster_path(path))
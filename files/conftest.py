@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Test fixtures
+
+Description: Fixtures shared by the tests of the modules (test_<module>.py). The tests are small,
+deterministic checks of the guarantees the modules make to each other, run with pytest from the
+files directory:
+
+	python -m pytest -q
+
+"""
+
+import numpy as np
+import pytest
+import simulation as sm
+
+BACKENDS = (sm.Simulation, sm.VectorSimulation)
+"""tuple: Simulation classes of the object and the array backend."""
+
+
+def agents(simulation):
+    """return: Array with the x and y coordinate and the store of every sheep."""
+    herd = simulation.herd
+    if isinstance(simulation, sm.VectorSimulation):
+        return np.column_stack((herd.x, herd.y, herd.store))
+    return np.array([(s.x, s.y, s.store) for s in herd], dtype=float).reshape(-1, 3)
+
+
+@pytest.fixture
+def field():
+    """return: Reproducible 40 by 40 raster of random grass. Every simulation copies it."""
+    return np.random.default_rng(0).uniform(0, 100, (40, 40))
+
+
+@pytest.fixture
+def same_run():
+    """return: Function checking that two simulations ended in the same state."""
+    def check(a, b):
+        assert (a.steps, a.updates, a.extinction_step) == (b.steps, b.updates, b.extinction_step)
+        assert len(a.wolves) == len(b.wolves)
+        np.testing.assert_array_equal(agents(a), agents(b))
+        np.testing.assert_array_equal(np.asarray(a.environment), np.asarray(b.environment))
+    return check
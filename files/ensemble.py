@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Ensemble
+
+Description: Runs many independent replicates (worlds) of the model at once on the array backend.
+With only tens of agents per world, running replicates one after the other mostly costs
+interpreter overhead: every phase of every iteration is a round of small array operations per
+world. The ensemble stacks the worlds instead, so every phase advances all of them in one pass.
+Even sequential sharing, where the sheep of a world share one after the other, advances all the
+worlds together, in as many rounds as the largest world has sheep.
+
+The starting raster is copied once per world into a single stacked raster: world r occupies the
+rows r * stride to r * stride + height - 1. Consecutive worlds are separated by empty rows
+further apart than any interaction distance, so the spatial index never pairs agents of different
+worlds, and agents wrap around the edges of their own world. The sheep of all worlds are kept in
+one Herd and the wolves in one Pack, both sorted by world, with the world of every agent in an
+extra column.
+
+Every world has its own RandomStreams and draws from them exactly the numbers a VectorSimulation
+seeded the same way would draw, in the same order, so world r follows the same run as
+VectorSimulation(environment, seed=ensemble.seeds[r], ...) with the same parameters: the same
+agents, raster and number of iterations. Only the remaining grass may differ in the last digits,
+as it is summed from the rows of the world rather than kept as a running total.
+
+Each world stops on its own by the criteria of Simulation.frames: when its herd died out, its
+grass is exhausted or it ran max_iterations model updates. The agents of a stopped world are
+removed from the populations and its raster is no longer regrown, so it stays as it ended.
+
+Class Herd: arrayframework.Herd holding the sheep of every world.
+
+Class Pack: arrayframework.Pack holding the wolves of every world.
+
+Class Ensemble: Generates the worlds, advances them and summarises them.
+
+The ensemble can be run from the command line with name=value arguments for the model parameters,
+for example:
+
+	python ensemble.py replicates=1000 num_of_sheep=50 seed=0 out=ensemble.json
+
+"""
+
+import json
+import math
+import os
+import sys
+import numpy as np
+import arrayframework as arf
+import profiling
+import raster
+import simulation as sm
+import streams
+
+RASTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "in.txt")
+"""str: Default environment raster."""
+
+QUANTITIES = ('sheep', 'wolves', 'grass')
+"""tuple: Quantities recorded for every world after every model update, see Ensemble.history."""
+
+
+def _uniform(rng, n):
+    """return: n uniform random numbers in [0, 1)."""
+    return rng.random(n)
+
+
+def _draw(generators, counts, draw):
+    """Draw random values world by world from the generator of each world.
+
+    args:
+        generators (list): NumPy random generator of every world.
+        counts (ndarray): Number of values drawn for every world.
+        draw (callable): Called with a generator and a number n, returns n values.
+
+    return: The values of every world, concatenated in world order.
+
+    """
+    parts = [draw(generators[r], counts[r]) for r in np.flatnonzero(counts)]
+    return np.concatenate(parts) if parts else draw(generators[0], 0)
+
+
+class _Stacked:
+    """Per-world random numbers and ordering shared by the Herd and Pack of an Ensemble.
+
+    The rng of the population is the list of the generators of every world.
+
+    """
+
+    def _random(self, index=None):
+        """Draw one uniform random number per agent from the generator of its world.
+
+        arg:
+            index (ndarray): Rows of the agents, in increasing order. Every agent if None.
+
+        """
+        world = self.world if index is None else self.world[index]
+        return _draw(self.rng, np.bincount(world, minlength=len(self.rng)), _uniform)
+
+    def _sort(self):
+        """Sort the agents by world, keeping the order within every world."""
+        if np.any(self.world[1:] < self.world[:-1]):
+            order = np.argsort(self.world, kind='stable')
+            for name, dtype in self.fields:
+                setattr(self, name, getattr(self, name)[order])
+
+
+class Herd(_Stacked, arf.Herd):
+    """Sheep of every world of an Ensemble.
+
+    Coordinates are rows and columns of the stacked raster.
+
+    Args:
+        ensemble (Ensemble): Ensemble the herd belongs to.
+        num_of_sheep (int): Number of sheep to generate in every world.
+
+    Attributes:
+        world (ndarray): World of each sheep. The herd is sorted by world.
+
+    See arrayframework.Herd for the other attributes.
+
+    """
+
+    fields = arf.Herd.fields + (('world', np.int64),)
+
+    def __init__(self, ensemble, num_of_sheep=0):
+        self.ensemble = ensemble
+        super().__init__(ensemble.environment, num_of_sheep, [s.numpy('sheep') for s in ensemble.streams])
+
+    def add(self, n):
+        """Generate sheep at random locations, like arrayframework.Herd.add.
+
+        arg:
+            n (int or ndarray): Number of sheep generated in every world, or in each world.
+
+        """
+        e = self.ensemble
+        counts = np.broadcast_to(n, len(self.rng))
+        world = np.repeat(np.arange(len(counts)), counts)
+        y = _draw(self.rng, counts, lambda rng, k: rng.integers(0, e.height, k)) + world * e.stride
+        x = _draw(self.rng, counts, lambda rng, k: rng.integers(0, e.width, k))
+        female = _draw(self.rng, counts, _uniform) >= 0.5
+        self._append(y=y, x=x, alive=np.ones(len(y), dtype=bool), female=female,
+                     reproduce=female, org_y=y, org_x=x, origin=np.full(len(y), -1), world=world)
+        self._sort()
+
+    def move(self):
+        """Move every sheep one pixel in a random direction along x and y, wrapping around its world."""
+        e = self.ensemble
+        top = self.world * e.stride
+        self.x = (self.x + np.where(self._random() < 0.5, 1, -1)) % e.width
+        self.y = top + (self.y - top + np.where(self._random() < 0.5, 1, -1)) % e.height
+
+    def share_with_neighbours(self, neighbourhood, order=None):
+        """Share environment with neighbours, like arrayframework.Herd.share_with_neighbours.
+
+        The sheep of a world still share one after the other, but the worlds advance together:
+        in round k the k-th sheep in the order of every world averages its store with its
+        neighbours, which all live in its own world, so the sheep of one round are handled at
+        once with their neighbours padded into one array. There are as many rounds as sheep in
+        the largest world instead of as many as sheep in all worlds, and every store comes out
+        as with arrayframework.Herd.share_with_neighbours, to the last bit.
+
+        args:
+            neighbourhood (int): Distance within which sheep can share with each other.
+            order (ndarray): Permutation of the herd giving the order in which sheep share, the
+            sheep of every world in one block in world order. Herd order if None.
+
+        """
+        store = self.store
+        order = np.arange(len(self)) if order is None else order
+        rank = np.empty(len(self), dtype=np.int64)
+        rank[order] = np.arange(len(self))
+        i, j = self._neighbours(neighbourhood)
+        if not len(i):
+            return
+        by_rank = np.lexsort((rank[j], i))
+        i, j = i[by_rank], j[by_rank]
+        start = np.searchsorted(i, np.arange(len(self)))
+        degree = np.bincount(i, minlength=len(self))
+        counts = np.bincount(self.world, minlength=len(self.rng))
+        turn = rank - (np.cumsum(counts) - counts)[self.world]
+        """Position of every sheep in the order of its world."""
+        sharing = np.flatnonzero(degree)
+        sharing = sharing[np.argsort(turn[sharing], kind='stable')]
+        for rows in np.split(sharing, np.flatnonzero(np.diff(turn[sharing])) + 1):
+            d = degree[rows]
+            column = np.arange(d.max())
+            padded = column < d[:, None]
+            near = j[np.where(padded, start[rows, None] + column, 0)]
+            last, out = arf.sequential_average(store[rows], np.where(padded, store[near], 0.0))
+            store[rows] = out[np.arange(len(rows)), d - 1]
+            """The padding after the last neighbour of a sheep changes neither its store nor theirs."""
+            store[near[padded]] = out[padded]
+
+
+class Pack(_Stacked, arf.Pack):
+    """Wolves of every world of an Ensemble.
+
+    Coordinates are rows and columns of the stacked raster.
+
+    Args:
+        ensemble (Ensemble): Ensemble the pack belongs to.
+        num_of_wolves (int): Number of wolves to generate in every world.
+
+    Attributes:
+        world (ndarray): World of each wolf. The pack is sorted by world.
+
+    See arrayframework.Pack for the other attributes.
+
+    """
+
+    fields = arf.Pack.fields + (('world', np.int64),)
+
+    def __init__(self, ensemble, num_of_wolves=0):
+        self.ensemble = ensemble
+        super().__init__(num_of_wolves, [s.numpy('wolves') for s in ensemble.streams],
+                         ensemble.height, ensemble.width)
+
+    def add(self, n):
+        """Generate wolves at random locations, like arrayframework.Pack.add.
+
+        arg:
+            n (int or ndarray): Number of wolves generated in every world, or in each world.
+
+        """
+        counts = np.broadcast_to(n, len(self.rng))
+        world = np.repeat(np.arange(len(counts)), counts)
+        y = _draw(self.rng, counts, lambda rng, k: rng.integers(0, self.height, k))
+        x = _draw(self.rng, counts, lambda rng, k: rng.integers(0, self.width, k))
+        self._append(y=y + world * self.ensemble.stride, x=x, alive=np.ones(len(y), dtype=bool), world=world)
+        self._sort()
+
+    def hunt_sheep(self):
+        """Move every wolf 2.5px along x and y, wrapping around its world, and increase its risk of starving."""
+        top = self.world * self.ensemble.stride
+        self.x = (self.x + np.where(self._random() < 0.5, 2.5, -2.5)) % self.width
+        self.y = top + (self.y - top + np.where(self._random() < 0.5, 2.5, -2.5)) % self.height
+        self.starving += 1
+
+
+class Ensemble:
+    """Generate R independent worlds and advance them together.
+
+    Args:
+        environment (array_like): Starting raster of every world. Each world works on its own copy.
+        replicates (int): Number of worlds.
+        num_of_sheep, num_of_wolves, num_of_iterations, neighbourhood, max_iterations, regrowth,
+        spread, capacity, share: Model parameters of every world, see Simulation.
+        seed (int or list): Seed of the ensemble, from which one seed per world is derived, or the list
+        of the seeds of every world. Fresh entropy is used if None.
+
+    Attributes:
+        replicates (int): Number of worlds.
+        environment (Environment): Stacked raster of every world.
+        height, width (int): Extent of a world.
+        stride (int): Number of rows from the first row of a world to the first row of the next one.
+        seeds (list): Seed of every world.
+        streams (list): RandomStreams of every world.
+        herd (Herd): Sheep of every world.
+        wolves (Pack): Wolves of every world.
+        active (ndarray): True for the worlds still running.
+        steps (ndarray): Number of iterations run by each world.
+        updates (ndarray): Number of model updates run by each world.
+        extinction_step (ndarray): Iteration after which the herd of each world died out, -1 while sheep are left.
+        state (dict): Number of sheep, number of wolves and remaining grass of every world after its
+        last model update, keyed by QUANTITIES.
+        history (dict): State of every world after every model update, keyed by QUANTITIES, see trajectory.
+        profiler (Profiler): Times the phases of every iteration. profiling.NULL unless profile() was called.
+
+    """
+
+    def __init__(self, environment, replicates, num_of_sheep=10, num_of_wolves=2, num_of_iterations=10,
+                 neighbourhood=20, max_iterations=1000, regrowth=0.0, spread=0.0, capacity=None,
+                 share='sequential', seed=None):
+        """Stack the environment and generate the herd and the wolves of every world."""
+        start = np.asarray(environment, dtype=float)
+        sm.set_parameters(self, start, num_of_iterations, neighbourhood, max_iterations, regrowth, spread,
+                          capacity, share)
+        self.replicates = replicates
+        self.height, self.width = start.shape
+        self.stride = self.height + math.ceil(max(neighbourhood, 5)) + 1
+        """Gap rows wider than the neighbourhood and the 5px mating distance, the longest interactions."""
+        stacked = np.zeros((replicates, self.stride, self.width))
+        stacked[:, :self.height] = start
+        self.environment = raster.Environment(stacked.reshape(-1, self.width))
+        if isinstance(seed, (list, tuple)):
+            self.seeds = list(seed)
+        else:
+            self.seeds = [int(s) for s in np.random.SeedSequence(seed).generate_state(replicates, np.uint64)]
+        if len(self.seeds) != replicates:
+            raise ValueError('seed must give one seed per world')
+        self.streams = [streams.RandomStreams(s) for s in self.seeds]
+        self.herd = Herd(self, num_of_sheep)
+        self.wolves = Pack(self, num_of_wolves)
+        self.active = np.ones(replicates, dtype=bool)
+        self.steps = np.zeros(replicates, dtype=np.int64)
+        self.updates = np.zeros(replicates, dtype=np.int64)
+        self.extinction_step = np.full(replicates, -1, dtype=np.int64)
+        self.state = {name: np.zeros(replicates) for name in QUANTITIES}
+        self.history = {name: [] for name in QUANTITIES}
+        self.profiler = profiling.NULL
+        self._observe()
+
+    def profile(self, profiler=None):
+        """Enable profiling of every iteration, see Simulation.profile.
+
+        return: The profiler.
+
+        """
+        self.profiler = profiler or profiling.Profiler()
+        self.herd.counts = self.profiler.counts
+        return self.profiler
+
+    def grass(self):
+        """return: Remaining grass of every world, summed from the running sums of its rows."""
+        return self.environment.row_sums.reshape(self.replicates, self.stride).sum(axis=1)
+
+    def _observe(self):
+        """Update the state of the running worlds."""
+        active = self.active
+        self.state['sheep'][active] = np.bincount(self.herd.world, minlength=self.replicates)[active]
+        self.state['wolves'][active] = np.bincount(self.wolves.world, minlength=self.replicates)[active]
+        self.state['grass'][active] = self.grass()[active]
+
+    def step(self):
+        """Run one iteration of the model in every running world.
+
+        The phases and the random numbers drawn by every world are those of VectorSimulation.step:
+        wolves hunt, starve and catch the weak sheep, sheep move, eat in the order of a random
+        permutation of the herd of their world, share and mate, lambs join the herd, then the
+        population control of each world may add a wolf or start a disease outbreak, and the
+        grass regrows.
+
+        """
+        herd, wolves = self.herd, self.wolves
+        r = self.replicates
+        profiler = self.profiler
+        lap = profiler.lap
+        profiler.start(int(self.steps.max()))
+        wolves.hunt_sheep()
+        wolves.starve()
+        wolves.compact()
+        lap('hunt_sheep')
+
+        wolves.catch_sheep(herd)
+        herd.compact()
+        lap('catch_sheep')
+        herd.move()
+        lap('move')
+        counts = np.bincount(herd.world, minlength=r)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        order = _draw([s.numpy('order') for s in self.streams], counts, lambda rng, k: rng.permutation(k)) + first
+        """One permutation per world, offset to the rows of its sheep."""
+        herd.eat(order)
+        lap('eat')
+        if self.share == 'batched':
+            herd.share_batched(self.neighbourhood)
+        else:
+            herd.share_with_neighbours(self.neighbourhood, order)
+        lap('share_with_neighbours')
+        fertile = herd.reproduce & herd.alive
+        herd.mate()
+        herd.add(np.bincount(herd.world[fertile & ~herd.reproduce], minlength=r))
+        """Fertile females who are no longer fertile after mating have mated, each giving birth to one lamb."""
+        lap('mate')
+
+        control = [s.numpy('control') for s in self.streams]
+        new_wolves = np.zeros(r, dtype=np.int64)
+        for world in np.flatnonzero(self.active):
+            new_wolves[world] = control[world].random() < 0.01
+        wolves.add(new_wolves)
+        counts = np.bincount(herd.world, minlength=r)
+        outbreak = np.where(counts > 100, counts, 0)
+        if outbreak.any():
+            herd.alive[outbreak[herd.world] > 0] &= _draw(control, outbreak, _uniform) >= 0.8
+        herd.compact()
+        lap('population_control')
+        self.grow()
+        lap('regrowth')
+        profiler.stop()
+        self.steps[self.active] += 1
+
+    def grow(self):
+        """Let the grass spread and regrow in every running world, if enabled."""
+        if self.regrowth or self.spread:
+            env = self.environment
+            worlds = env.raster.reshape(self.replicates, self.stride, self.width)[:, :self.height]
+            if self.active.all():
+                raster.regrow(worlds, self.regrowth, self.capacity, self.spread)
+            else:
+                running = worlds[self.active]
+                raster.regrow(running, self.regrowth, self.capacity, self.spread)
+                worlds[self.active] = running
+            env.row_sums = env.raster.sum(axis=1)
+            env.total = float(env.row_sums.sum())
+
+    def update(self, frame_number=None):
+        """Run one model update, num_of_iterations iterations, in every running world.
+
+        arg:
+            frame_number (int): Frame number passed through by frames(). Not used.
+
+        """
+        for j in range(self.num_of_iterations):
+            self.step()
+            extinct = self.active & (self.extinction_step < 0)
+            extinct[extinct] = np.bincount(self.herd.world, minlength=self.replicates)[extinct] == 0
+            self.extinction_step[extinct] = self.steps[extinct]
+        self.updates[self.active] += 1
+        self._observe()
+        for name in QUANTITIES:
+            self.history[name].append(self.state[name].copy())
+
+    def carry_on(self):
+        """Evaluate the stopping criteria of every world and stop the worlds meeting one.
+
+        A world keeps running while it has sheep, grass and ran less than max_iterations model
+        updates, like Simulation.frames. The agents of a world that stops are removed.
+
+        return: True while any world is running.
+
+        """
+        scale = self.environment.start_total / self.replicates
+        exhausted = self.active & raster.near_zero(self.state['grass'], scale)
+        if exhausted.any():
+            worlds = self.environment.raster.reshape(self.replicates, self.stride, self.width)[exhausted]
+            exhausted[exhausted] = ~(worlds > 0).any(axis=(1, 2))
+            """Grass totals close to zero may be rounding drift, like Environment.exhausted."""
+        running = self.active & (self.updates < self.max_iterations) & (self.state['sheep'] > 0) & ~exhausted
+        stopped = self.active & ~running
+        if stopped.any():
+            for population in (self.herd, self.wolves):
+                population.alive &= ~stopped[population.world]
+                population.compact()
+        self.active = running
+        return bool(running.any())
+
+    def frames(self):
+        """Yield model update numbers until every world has stopped, see carry_on."""
+        a = int(self.updates.max())
+        while self.carry_on():
+            yield a
+            a = a + 1
+
+    def run(self):
+        """Run model updates until every world has stopped.
+
+        return: The ensemble, to allow chaining.
+
+        """
+        for frame_number in self.frames():
+            self.update(frame_number)
+        return self
+
+    def trajectory(self, name):
+        """return: Array with one row per model update and one column per world of a quantity of QUANTITIES.
+        Stopped worlds keep their last value."""
+        return np.array(self.history[name]).reshape(-1, self.replicates)
+
+    def statistics(self, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """Summarise the ensemble.
+
+        arg:
+            quantiles (tuple): Quantiles reported for every quantity.
+
+        return: Dictionary with the number of worlds and of worlds still running, the share of
+        worlds whose herd died out and, for the number of sheep, the number of wolves, the
+        remaining grass, the number of iterations run and the extinction step (of the worlds
+        whose herd died out), the mean, standard deviation, minimum, maximum and quantiles
+        across the worlds.
+
+        """
+        extinct = self.extinction_step >= 0
+        values = dict(self.state, steps=self.steps, extinction_step=self.extinction_step[extinct])
+        summary = {'replicates': self.replicates, 'running': int(self.active.sum()),
+                   'extinct': float(extinct.mean())}
+        for name, value in values.items():
+            if not len(value):
+                summary[name] = None
+                continue
+            summary[name] = {'mean': float(value.mean()), 'std': float(value.std()),
+                             'min': float(value.min()), 'max': float(value.max()),
+                             'quantiles': {'{:g}'.format(q): float(v)
+                                           for q, v in zip(quantiles, np.quantile(value, quantiles))}}
+        return summary
+
+
+if __name__ == '__main__':
+    from sweep import PARAMETERS, TYPES
+    parameters, options = {}, {'replicates': '100', 'seed': '0', 'out': ''}
+    for argument in sys.argv[1:]:
+        name, _, value = argument.partition('=')
+        if name in PARAMETERS:
+            parameters[name] = TYPES.get(name, int)(value)
+        elif name in options:
+            options[name] = value
+        else:
+            print('Unknown argument ' + argument + '\nParameters: ' + ', '.join(PARAMETERS) +
+                  '\nOptions: replicates, seed, out')
+            sys.exit(1)
+
+    ensemble = Ensemble(raster.load_raster(RASTER_PATH), int(options['replicates']),
+                        seed=int(options['seed']), **parameters).run()
+    statistics = ensemble.statistics()
+    if options['out']:
+        with open(options['out'], 'w') as file:
+            json.dump(statistics, file, indent=1)
+    print(json.dumps(statistics, indent=1))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Export
+
+Description: Headless export of a run to a PNG sequence or a video, drawn by a separate render
+worker process so the simulation keeps stepping while frames are produced.
+
+After every model update (or every iteration), one in every few snapshots is copied into a ring of
+shared memory blocks: the environment raster followed by the coordinates of the sheep and of the
+wolves. Only the number of the block and a few counts are sent to the worker through a queue. The
+worker draws the snapshot with matplotlib's non-interactive Agg backend, writes the frame and
+hands the block back. The simulation only waits when every block is still waiting to be drawn,
+unless frames may be dropped instead.
+
+Class Exporter: Subscribes to a simulation and feeds the render worker.
+
+"""
+
+import multiprocessing as mp
+import os
+import queue
+from multiprocessing import shared_memory
+import numpy as np
+import simulation as sm
+
+WRITERS = {'mp4': 'ffmpeg', 'gif': 'pillow'}
+"""dict: Video formats and the matplotlib animation writer encoding them. Anything else is written as PNG frames."""
+
+
+def _render(names, shape, capacity, jobs, free, directory, fmt, fps, dpi):
+    """Draw the snapshots sent by an Exporter until it sends None. Runs in the render worker process.
+
+    args:
+        names (list): Names of the shared memory blocks.
+        shape (tuple): Height and width of the raster.
+        capacity (int): Number of agent coordinates each block holds.
+        jobs (Queue): Snapshots to draw: block number, step, number of sheep, number of wolves and
+        the coordinates if they did not fit in the block.
+        free (Queue): Blocks handed back once drawn.
+        directory (str): Directory of the frames or the video.
+        fmt (str): 'png' or a key of WRITERS.
+        fps (int): Frames per second of the video.
+        dpi (int): Resolution of the frames.
+
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as anm
+
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    size = shape[0] * shape[1]
+    fig = ax = writer = None
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            slot, step, n_sheep, n_wolves, coordinates = job
+            raster = np.ndarray(shape, dtype=float, buffer=blocks[slot].buf)
+            if coordinates is None:
+                coordinates = np.ndarray((capacity, 2), dtype=float, buffer=blocks[slot].buf, offset=size * 8)
+            if fig is None:
+                fig = plt.figure(figsize=(7, 7))
+                fig.patch.set_facecolor('#dedede')
+                ax = fig.add_subplot()
+                image = ax.imshow(raster, cmap='summer_r', vmin=0, vmax=raster.max())
+                """The colour range is fixed by the first frame, like in the renderer."""
+                fig.colorbar(image, orientation="horizontal")
+                sheep = ax.scatter([], [], color='white')
+                wolves = ax.scatter([], [], color='red')
+                legend = ax.legend([sheep, wolves], ['Sheep', 'Wolf'], loc=9, ncol=2, frameon=False)
+                ax.set_xlim(0, shape[1] - 1)
+                ax.set_ylim(0, shape[0] - 1)
+                fig.suptitle('Sheep and Wolves', fontsize=20, color='#0d6d13')
+                if fmt in WRITERS:
+                    writer = anm.writers[WRITERS[fmt]](fps=fps)
+                    writer.setup(fig, os.path.join(directory, 'animation.' + fmt), dpi=dpi)
+            image.set_data(raster)
+            sheep.set_offsets(coordinates[:n_sheep])
+            wolves.set_offsets(coordinates[n_sheep:n_sheep + n_wolves])
+            labels = legend.get_texts()
+            labels[0].set_text("Sheep #(" + str(n_sheep) + ')')
+            labels[1].set_text("Wolf #(" + str(n_wolves) + ')')
+            ax.set_title('Iteration ' + str(step), fontsize=12, loc='center', color='#4b4f4c')
+            if writer is not None:
+                writer.grab_frame()
+            else:
+                fig.savefig(os.path.join(directory, 'frame_{:08d}.png'.format(step)), dpi=dpi)
+            free.put(slot)
+    finally:
+        if writer is not None:
+            writer.finish()
+        for block in blocks:
+            block.close()
+
+
+class Exporter:
+    """Export the snapshots of a simulation through a render worker process.
+
+    Args:
+        simulation (Simulation): Simulation to be exported. The exporter subscribes to it.
+        directory (str): Directory of the frames or the video. Created if missing.
+        every (int): Export one snapshot in every `every` (frame decimation).
+        every_step (bool): Take snapshots after every iteration instead of every model update.
+        fmt (str): 'png' for a sequence of PNG files, or 'mp4' or 'gif' for a video.
+        fps (int): Frames per second of the video.
+        dpi (int): Resolution of the frames.
+        slots (int): Number of shared memory blocks, the number of snapshots waiting to be drawn.
+        capacity (int): Number of agent coordinates a block holds. Snapshots with more agents send
+        their coordinates through the queue instead.
+        drop (bool): Drop a snapshot when every block is still waiting to be drawn, instead of waiting.
+
+    Attributes:
+        exported (int): Number of snapshots sent to the worker.
+        dropped (int): Number of snapshots dropped.
+
+    """
+
+    def __init__(self, simulation, directory, every=1, every_step=False, fmt='png', fps=10, dpi=100,
+                 slots=4, capacity=65536, drop=False):
+        if fmt in WRITERS:
+            import matplotlib.animation as anm
+            if not anm.writers.is_available(WRITERS[fmt]):
+                raise ValueError('Cannot write ' + fmt + ' videos: ' + WRITERS[fmt] + ' is not available')
+        elif fmt != 'png':
+            raise ValueError('fmt must be png or one of ' + ', '.join(WRITERS))
+        os.makedirs(directory, exist_ok=True)
+        self.every = every
+        self.capacity = capacity
+        self.drop = drop
+        self.shape = np.asarray(simulation.environment).shape
+        self.calls = self.exported = self.dropped = 0
+        size = self.shape[0] * self.shape[1]
+        self.blocks = [shared_memory.SharedMemory(create=True, size=(size + 2 * capacity) * 8) for i in range(slots)]
+        self.jobs, self.free = mp.Queue(), mp.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.worker = mp.Process(target=_render, daemon=True,
+                                 args=([block.name for block in self.blocks], self.shape, capacity, self.jobs,
+                                       self.free, directory, fmt, fps, dpi))
+        self.worker.start()
+        simulation.subscribe(self.capture, every_step=every_step)
+
+    def capture(self, simulation):
+        """Copy a snapshot of the simulation into a free block and send it to the worker.
+
+        Raises RuntimeError if the worker has stopped, for example because drawing a frame failed.
+
+        """
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return
+        slot = None
+        while slot is None:
+            try:
+                slot = self.free.get(block=not self.drop, timeout=1.0)
+            except queue.Empty:
+                if not self.worker.is_alive():
+                    """A worker that died never hands a block back, so stop instead of waiting forever."""
+                    raise RuntimeError('The render worker stopped with exit code ' + str(self.worker.exitcode))
+                if self.drop:
+                    self.dropped += 1
+                    return
+        block = self.blocks[slot].buf
+        np.ndarray(self.shape, dtype=float, buffer=block)[...] = np.asarray(simulation.environment)
+        sheep, wolves = sm.positions(simulation.herd), sm.positions(simulation.wolves)
+        n = len(sheep) + len(wolves)
+        if n <= self.capacity:
+            coordinates = np.ndarray((self.capacity, 2), dtype=float, buffer=block,
+                                     offset=self.shape[0] * self.shape[1] * 8)
+            coordinates[:len(sheep)] = sheep
+            coordinates[len(sheep):n] = wolves
+            self.jobs.put((slot, simulation.steps, len(sheep), len(wolves), None))
+        else:
+            self.jobs.put((slot, simulation.steps, len(sheep), len(wolves), np.concatenate((sheep, wolves))))
+        self.exported += 1
+
+    def close(self):
+        """Wait for the worker to draw the remaining snapshots, then release the shared memory."""
+        self.jobs.put(None)
+        self.worker.join()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Live
+
+Description: Optional local HTTP/WebSocket endpoint publishing the state of a running model, so
+headless runs can be watched from a browser while they step. Built on asyncio from the standard
+library only.
+
+The server runs its own event loop in a background thread. After every model update (or every
+iteration), one in every few calls the simulation thread takes a small snapshot: the step, the
+number of sheep and wolves, the remaining grass, the step rate, the raster averaged down to a few
+dozen pixels a side and a sample of the agent coordinates. The snapshot is handed to the event
+loop, which encodes it once and queues it for every connected client. The simulation never waits
+for the server or for a client: if the loop has not picked up the previous snapshot yet, it is
+replaced by the new one.
+
+Every client has a bounded buffer of snapshots. A writer task per client sends them as fast as the
+connection drains; while a slow client is busy, new snapshots push the oldest ones out of its
+buffer, so it always catches up with the most recent state and never holds back the others.
+
+Routes:
+
+	/ (HTML): Page drawing the raster, the agents and the counts, fed by the WebSocket.
+	/state (JSON): Latest snapshot.
+	/ws (WebSocket): Stream of snapshots as JSON text messages.
+
+Class LiveServer: Subscribes to a simulation, runs the server and publishes the snapshots.
+
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import math
+import threading
+import time
+import numpy as np
+import simulation as sm
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+"""bytes: Key suffix of the WebSocket handshake (RFC 6455)."""
+
+PAGE = b"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Sheep and Wolves</title></head>
+<body style="background:#dedede;font-family:sans-serif;color:#4b4f4c">
+<h2 style="color:#0d6d13">Sheep and Wolves</h2>
+<p id="counts">Waiting for the model...</p>
+<canvas id="field" width="560" height="560"></canvas>
+<script>
+var canvas = document.getElementById('field'), context = canvas.getContext('2d');
+var socket = new WebSocket('ws://' + location.host + '/ws');
+socket.onmessage = function (message) {
+  var state = JSON.parse(message.data), raster = state.raster;
+  var rows = raster.length, cols = raster[0].length, top = state.range[1] || 1;
+  var w = canvas.width / cols, h = canvas.height / rows;
+  for (var y = 0; y < rows; y++) {
+    for (var x = 0; x < cols; x++) {
+      var v = Math.round(200 * (1 - raster[y][x] / top));
+      context.fillStyle = 'rgb(' + v + ',' + (150 + v / 4) + ',' + v + ')';
+      context.fillRect(x * w, y * h, w + 1, h + 1);
+    }
+  }
+  var sx = canvas.width / state.shape[1], sy = canvas.height / state.shape[0];
+  [['sheep', 'white'], ['wolves', 'red']].forEach(function (kind) {
+    context.fillStyle = kind[1];
+    state.agents[kind[0]].forEach(function (p) { context.fillRect(p[0] * sx - 2, p[1] * sy - 2, 4, 4); });
+  });
+  document.getElementById('counts').textContent = 'Iteration ' + state.step + ' | Sheep ' + state.sheep +
+    ' | Wolves ' + state.wolves + ' | Grass ' + state.grass.toFixed(0) + ' | ' +
+    state.steps_per_second.toFixed(1) + ' steps/s';
+};
+</script></body></html>
+"""
+"""bytes: Page served on /."""
+
+
+def downsample(values, size):
+    """Average a raster down to at most size pixels a side.
+
+    args:
+        values (ndarray): Two dimensional raster.
+        size (int): Largest number of rows and columns of the result.
+
+    return: Raster of block averages, with one block height for the rows and one block width for the
+    columns so a long and narrow raster keeps at least one pixel across. The last rows and columns
+    are left out if the raster does not divide into whole blocks.
+
+    """
+    height, width = (max(1, math.ceil(n / size)) for n in values.shape)
+    rows, cols = values.shape[0] // height, values.shape[1] // width
+    return values[:rows * height, :cols * width].reshape(rows, height, cols, width).mean(axis=(1, 3))
+
+
+def _sample(coordinates, limit):
+    """return: At most limit rows of coordinates, evenly spaced, rounded to one decimal."""
+    if len(coordinates) > limit:
+        coordinates = coordinates[np.linspace(0, len(coordinates) - 1, limit).astype(np.int64)]
+    return np.round(coordinates, 1).tolist()
+
+
+def _frame(payload, opcode=0x1):
+    """return: Unmasked, unfragmented WebSocket frame carrying payload (text by default)."""
+    n = len(payload)
+    if n < 126:
+        header = bytes((0x80 | opcode, n))
+    elif n < 65536:
+        header = bytes((0x80 | opcode, 126)) + n.to_bytes(2, 'big')
+    else:
+        header = bytes((0x80 | opcode, 127)) + n.to_bytes(8, 'big')
+    return header + payload
+
+
+async def _read_frame(reader):
+    """Read one frame sent by a client. Client frames are always masked.
+
+    return: Opcode and unmasked payload.
+
+    """
+    first, second = await reader.readexactly(2)
+    n = second & 0x7f
+    if n == 126:
+        n = int.from_bytes(await reader.readexactly(2), 'big')
+    elif n == 127:
+        n = int.from_bytes(await reader.readexactly(8), 'big')
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = bytearray(await reader.readexactly(n))
+    for k in range(n):
+        payload[k] ^= mask[k % 4]
+    return first & 0x0f, bytes(payload)
+
+
+class _Client:
+    """Bounded buffer of encoded snapshots waiting to be sent to one WebSocket client.
+
+    Arg:
+        buffer (int): Number of snapshots held. The oldest is dropped when a new one arrives on a full buffer.
+
+    Attributes:
+        messages (deque): Encoded frames waiting to be sent.
+        ready (Event): Set when messages were added.
+        sent (int): Number of snapshots sent.
+        dropped (int): Number of snapshots dropped.
+
+    """
+
+    def __init__(self, buffer):
+        self.messages = collections.deque(maxlen=buffer)
+        self.ready = asyncio.Event()
+        self.sent = self.dropped = 0
+
+    def put(self, message):
+        """Queue a frame, dropping the oldest one if the buffer is full."""
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped += 1
+        self.messages.append(message)
+        self.ready.set()
+
+
+class LiveServer:
+    """Publish the state of a simulation over HTTP and WebSocket.
+
+    Args:
+        simulation (Simulation): Simulation to be published. The server subscribes to it until close().
+        host (str): Interface to listen on. Only the local machine by default.
+        port (int): Port to listen on. A free port is picked if 0, see the port attribute.
+        every (int): Publish one snapshot in every `every` (decimation).
+        every_step (bool): Take snapshots after every iteration instead of every model update.
+        size (int): Largest number of rows and columns of the raster sent.
+        max_agents (int): Largest number of sheep and of wolves whose coordinates are sent.
+        buffer (int): Number of snapshots buffered per client before the oldest are dropped.
+
+    Attributes:
+        port (int): Port the server listens on.
+        url (str): Address of the page.
+        latest (dict): Latest snapshot taken. None before the first one.
+        published (int): Number of snapshots handed to the event loop.
+        dropped (int): Number of snapshots replaced before the event loop picked them up.
+        clients (set): Buffers of the connected WebSocket clients.
+
+    """
+
+    def __init__(self, simulation, host='127.0.0.1', port=0, every=1, every_step=False, size=64,
+                 max_agents=1000, buffer=8):
+        self.host = host
+        self.every = every
+        self.size = size
+        self.max_agents = max_agents
+        self.buffer = buffer
+        self.calls = self.published = self.dropped = 0
+        self.latest = None
+        self.clients = set()
+        self._connections = {}
+        self._pending = None
+        self._lock = threading.Lock()
+        self._clock = (simulation.steps, time.perf_counter())
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(port, started), daemon=True)
+        self.thread.start()
+        started.wait()
+        if self.server is None:
+            raise OSError('Cannot listen on ' + host + ':' + str(port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.url = 'http://' + host + ':' + str(self.port) + '/'
+        self.simulation = simulation
+        simulation.subscribe(self.publish, every_step=every_step)
+
+    def _run(self, port, started):
+        """Run the event loop of the server thread until close()."""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, port))
+        except OSError:
+            self.server = None
+        started.set()
+        if self.server is not None:
+            self.loop.run_forever()
+        self.loop.close()
+
+    def snapshot(self, simulation):
+        """Summarise the current state of a simulation.
+
+        return: Dictionary of plain Python values: step, model updates, number of sheep and wolves,
+        remaining grass, steps per second since the previous snapshot, shape and value range of the
+        raster, the downsampled raster and samples of the sheep and wolf coordinates (x, y).
+
+        """
+        steps, now = simulation.steps, time.perf_counter()
+        rate = (steps - self._clock[0]) / (now - self._clock[1]) if now > self._clock[1] else 0.0
+        self._clock = (steps, now)
+        values = np.asarray(simulation.environment)
+        small = downsample(values, self.size)
+        return {'step': steps, 'updates': simulation.updates, 'sheep': len(simulation.herd),
+                'wolves': len(simulation.wolves), 'grass': float(simulation.environment.total),
+                'steps_per_second': rate, 'shape': list(values.shape),
+                'range': [float(small.min()), float(small.max())], 'raster': np.round(small, 1).tolist(),
+                'agents': {'sheep': _sample(sm.positions(simulation.herd), self.max_agents),
+                           'wolves': _sample(sm.positions(simulation.wolves), self.max_agents)}}
+
+    def publish(self, simulation):
+        """Take a snapshot of the simulation and hand it to the event loop, without waiting for it."""
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return
+        state = self.snapshot(simulation)
+        with self._lock:
+            waiting = self._pending is not None
+            self._pending = state
+        if waiting:
+            self.dropped += 1
+        else:
+            self.loop.call_soon_threadsafe(self._broadcast)
+        self.published += 1
+
+    def _broadcast(self):
+        """Encode the pending snapshot once and queue it for every client. Runs in the event loop."""
+        with self._lock:
+            state, self._pending = self._pending, None
+        self.latest = state
+        message = _frame(json.dumps(state).encode())
+        for client in self.clients:
+            client.put(message)
+
+    async def _handle(self, reader, writer):
+        """Serve one connection: the page, the latest snapshot or a WebSocket stream."""
+        self._connections[asyncio.current_task()] = writer
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            lines = request.decode('latin-1').split('\r\n')
+            method, path = (lines[0].split() + ['', ''])[:2]
+            headers = dict((name.strip().lower(), value.strip())
+                           for name, _, value in (line.partition(':') for line in lines[1:] if line))
+            if method != 'GET':
+                self._respond(writer, '405 Method Not Allowed', 'text/plain', b'GET only\n')
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._stream(reader, writer, headers.get('sec-websocket-key', ''))
+            elif path == '/state':
+                self._respond(writer, '200 OK', 'application/json', json.dumps(self.latest).encode())
+            elif path == '/':
+                self._respond(writer, '200 OK', 'text/html; charset=utf-8', PAGE)
+            else:
+                self._respond(writer, '404 Not Found', 'text/plain', b'Not found\n')
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, content_type, body):
+        """Write a complete HTTP response and let the client close the connection."""
+        writer.write(('HTTP/1.1 ' + status + '\r\nContent-Type: ' + content_type + '\r\nContent-Length: ' +
+                      str(len(body)) + '\r\nCache-Control: no-store\r\nConnection: close\r\n\r\n').encode() + body)
+
+    async def _stream(self, reader, writer, key):
+        """Complete the WebSocket handshake, then send the snapshots until the client leaves."""
+        accept = base64.b64encode(hashlib.sha1(key.encode() + GUID).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: ' + accept + '\r\n\r\n').encode())
+        client = _Client(self.buffer)
+        if self.latest is not None:
+            client.put(_frame(json.dumps(self.latest).encode()))
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._send(client, writer))
+        listener = asyncio.ensure_future(self._listen(reader, writer))
+        try:
+            await asyncio.wait((sender, listener), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            listener.cancel()
+
+    @staticmethod
+    async def _send(client, writer):
+        """Send the snapshots buffered for a client until the connection drops."""
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                while client.messages:
+                    writer.write(client.messages.popleft())
+                    await writer.drain()
+                    """Waits while the connection is congested; meanwhile new snapshots push out the oldest."""
+                    client.sent += 1
+        except ConnectionError:
+            pass
+
+    @staticmethod
+    async def _listen(reader, writer):
+        """Answer the pings of a client and return when it closes or drops the connection."""
+        try:
+            while True:
+                opcode, payload = await _read_frame(reader)
+                if opcode == 0x8:
+                    writer.write(_frame(payload[:2], 0x8))
+                    return
+                if opcode == 0x9:
+                    writer.write(_frame(payload, 0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def _shutdown(self):
+        """Stop accepting connections and drop the open ones."""
+        self.server.close()
+        tasks = list(self._connections)
+        for writer in self._connections.values():
+            writer.transport.abort()
+        if tasks:
+            await asyncio.wait(tasks)
+        await self.server.wait_closed()
+
+    def close(self):
+        """Stop publishing the simulation, then stop the server and its thread."""
+        self.simulation.unsubscribe(self.publish)
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
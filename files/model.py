@@ -20,245 +20,213 @@ parameters:
 	neighbourhood (int): Size of the neighbourhood in which sheep can share grass.
 	max_iterations (int): Maximum number of iterations after which the model will stop.  
 
+Passing headless as an additional argument runs the model without plotting. Passing vectorized
+runs the model on the NumPy array backend (arrayframework) instead of one object per agent. Passing
+seed=<int> makes the run reproducible. Passing telemetry=<directory> streams the counts, births,
+deaths and remaining grass of every iteration to a columnar recording (see the telemetry module).
+Passing checkpoint=<directory> saves the full state of the model every checkpoint_every=<int> model
+updates (default 10), and resume=<file or directory> continues a run from a saved checkpoint,
+with the parameters and seed it was saved with unless they are given again on the command line.
+Passing tiled=<file> keeps the environment in a tiled, memory-mapped working file instead of
+memory (see raster.TiledEnvironment), for rasters larger than memory. Passing regrowth=<float>
+and spread=<float> lets the grass regrow and spread every iteration, up to capacity=<float>.
+Passing share=batched lets all sheep share their store at once, independent of their order and
+conserving the total store, instead of one after the other. Passing export=<directory> draws one
+in every export_every=<int> model updates (default 1) to PNG files, or to a video with
+export_format=mp4 or gif, in a separate process (see the export module); adding export_drop
+skips the frames the process cannot keep up with instead of waiting for it. Passing profile prints
+the time spent in every phase of an iteration at the end of the run, and profile=<file> also
+writes the per-iteration trace to a CSV file (see the profiling module). Passing serve=<port>
+publishes one in every serve_every=<int> model updates (default 1) on a local web page and
+WebSocket while the model runs, port 0 picking a free port (see the live module).
+The simulation itself lives in the simulation module and can be imported and run without this script.
+
 """
 
 
 import sys
-import matplotlib.pyplot as plt
-import matplotlib.animation as anm
-import agentframework as af
-import random as rnd
-
-
-global carry_on 
-environment = [] 
-"""list: Empty list to store environment raster data."""
-herd = []
-"""list: Empty list to store location and attributes for each sheep."""
-wolves = []
-"""list: Empty list to store location and attributes for each wolf."""
-
+import os
+import simulation as sm
+import raster
 
 
-ctrl = af.SheepPopControl()
-"""Import class Sheep_pop_control from agentframework."""
-
-for i in sys.argv:
+def read_parameters(argv):
     """Define model parameters.
-    
+
         num_of_sheep (int): Number of sheep at the beginning of the model.
         num_of_wolves (int): Number of sheep at the beginning of the model.
         num_of_iterations (int): Number of iterations after which the model will be updated.
-        neighbourhood (int): Size of the neighbourhood in which sheep can share grass.
         max_iterations (int): Maximum number of iterations after which the model will stop.
-        
-    """ 
-    if i in ['Help','help','h']:
-        """If user requests help print input requirements and exists the script."""
-        print('The program requires four arguments\nnumber of agents (int)\nnumber of wolfs (int)\n' +
-          'number of iterations (int)\n maximum number of iterations (int)\nsize of neighbourhoood (int)')
-        sys.exit()
-    else:
-        """ Define model parameters based on user input value.
-        
-            Assign default values for missing input parameters.            
-            Throw error message if user submits variable type other than integer.
-        """
-        try:
-            num_of_sheep = int(sys.argv[1]) if len(sys.argv)>1 else 10
-            num_of_wolves = int(sys.argv[2]) if len(sys.argv)>2 else 2
-            num_of_iterations = int(sys.argv[3]) if len(sys.argv)>3 else 10
-            neighbourhood = int(sys.argv[5]) if len(sys.argv)>4 else 20 
-            max_iterations = int(sys.argv[4]) if len(sys.argv)>5 else 1000
-            
-        except ValueError:
-            print('The program requires four arguments\nnumber of sheep (int)\nnumber of wolves (int)\n' +
-            'number of iterations (int)\n maximum number of iterations (int)\nsize of neighbourhoood (int)')
-
-
-with open("in.txt", "r", newline='\n') as file: 
-    """ Read environment raster data from file.
-        
-        rowlist (list): temporary list to store environment raster data        
-        Loop through each line in the file and add data to rowlist. 
-        
+        neighbourhood (int): Size of the neighbourhood in which sheep can share grass.
+
+    arg:
+        argv (list): Command line arguments, excluding the optional flags.
+
+    return: Dictionary of model parameters. Default values are assigned for missing input parameters.
+
     """
-    for line in file:
-        rowlist  = []
-        line = line.replace('\n','').split(',')
-        """Remove line-breaks and convert comma separated values into a list. """
-        for value in (line):
-            """Loop through each value in line."""
-            rowlist.append(int(value))
-            """Add each value to the list."""
-        environment.append(rowlist)
-        """Add raster to the environment list."""
-    file.close()
-
-
-for i in range(num_of_sheep):
-    """Generate sheep herd.
-    
-       Loop through the number of sheep to be generated and add each sheep 
-       to the herd list. Use the Sheep class from the agentframework to 
-       create the x/y coordinates for each sheep.
-       
-       The __str__ class has been overridden to print the original location 
+    return dict(num_of_sheep=int(argv[1]) if len(argv) > 1 else 10,
+                num_of_wolves=int(argv[2]) if len(argv) > 2 else 2,
+                num_of_iterations=int(argv[3]) if len(argv) > 3 else 10,
+                max_iterations=int(argv[4]) if len(argv) > 4 else 1000,
+                neighbourhood=int(argv[5]) if len(argv) > 5 else 20)
+
+
+usage = ('The program requires four arguments\nnumber of sheep (int)\nnumber of wolves (int)\n' +
+         'number of iterations (int)\n maximum number of iterations (int)\nsize of neighbourhoood (int)\n' +
+         'Add headless to run the model without plotting.\n' +
+         'Add vectorized to run the model on the array backend.\n' +
+         'Add seed=<int> to make the run reproducible.\n' +
+         'Add telemetry=<directory> to record every iteration.\n' +
+         'Add checkpoint=<directory> and checkpoint_every=<int> to save checkpoints.\n' +
+         'Add resume=<file or directory> to continue from a checkpoint.\n' +
+         'Add tiled=<file> to keep the environment in a tiled working file.\n' +
+         'Add regrowth=<float>, spread=<float> and capacity=<float> to let the grass regrow.\n' +
+         'Add share=batched to let all sheep share at once.\n' +
+         'Add export=<directory>, export_every=<int> and export_format=<png, mp4 or gif> to export frames.\n' +
+         'Add export_drop to skip frames instead of waiting for the export.\n' +
+         'Add profile or profile=<file> to time every phase of the model.\n' +
+         'Add serve=<port> and serve_every=<int> to watch the model from a browser.')
+
+if any(i in ['Help','help','h'] for i in sys.argv):
+    """If user requests help print input requirements and exists the script."""
+    print(usage)
+    sys.exit()
+
+profile = 'profile' in sys.argv
+"""Boolean: Print the time spent in every phase of the model."""
+headless = 'headless' in sys.argv
+"""Boolean: Run the model without plotting."""
+vectorized = 'vectorized' in sys.argv
+"""Boolean: Run the model on the array backend."""
+export_drop = 'export_drop' in sys.argv
+"""Boolean: Skip the frames the export cannot keep up with."""
+options = dict(i.split('=', 1) for i in sys.argv[1:] if '=' in i)
+"""dict: Options passed as name=value."""
+arguments = [i for i in sys.argv if i not in ('headless', 'vectorized', 'profile', 'export_drop') and '=' not in i]
+"""list: Script name and the positional model parameters given on the command line."""
+try:
+    parameters = read_parameters(arguments)
+    seed = int(options['seed']) if 'seed' in options else None
+    """int: Seed of the random number streams."""
+    parameters.update({name: float(options[name]) for name in ('regrowth', 'spread', 'capacity') if name in options})
+    if 'share' in options:
+        if options['share'] not in sm.SHARE_MODES:
+            raise ValueError('share must be one of ' + ', '.join(sm.SHARE_MODES))
+        parameters['share'] = options['share']
+except ValueError:
+    """Throw error message if user submits variable type other than integer, or an unknown way of sharing."""
+    print(usage)
+    sys.exit(1)
+
+environment = raster.load_raster(os.path.join(os.path.dirname(os.path.abspath(__file__)), "in.txt"))
+"""ndarray: Environment raster data, read from the binary cache if present."""
+
+if 'resume' in options:
+    import checkpoint
+    path = options['resume']
+    if os.path.isdir(path):
+        path = checkpoint.latest(path)
+        if path is None:
+            print('No checkpoint found in ' + options['resume'])
+            sys.exit(1)
+    overrides = {name: value for name, value in parameters.items()
+                 if name in options or name in list(parameters)[:len(arguments) - 1]}
+    """dict: Parameters given on the command line, replacing the ones the checkpoint was saved with."""
+    sim = checkpoint.load(path, tiled=options.get('tiled'), seed=seed, **overrides)
+    """Simulation: Restored from a checkpoint, with its saved parameters unless given again."""
+else:
+    if 'tiled' in options:
+        environment = raster.TiledEnvironment(options['tiled'], environment)
+        """TiledEnvironment: Working copy of the raster in a memory-mapped file, loaded tile by tile."""
+    sim = (sm.VectorSimulation if vectorized else sm.Simulation)(environment, seed=seed, **parameters)
+    """Simulation: Generates the herd and the wolves and advances the model."""
+herd = sim.herd
+wolves = sim.wolves
+
+if 'checkpoint' in options:
+    import checkpoint
+    checkpointer = checkpoint.Checkpointer(sim, options['checkpoint'], every=int(options.get('checkpoint_every', 10)))
+    """Checkpointer: Saves the state of the model at a fixed interval."""
+
+if 'telemetry' in options:
+    import telemetry
+    recorder = telemetry.Recorder(sim, options['telemetry'])
+    """Recorder: Streams every iteration to the telemetry directory."""
+
+if 'export' in options:
+    import export
+    exporter = export.Exporter(sim, options['export'], every=int(options.get('export_every', 1)),
+                               fmt=options.get('export_format', 'png'), drop=export_drop)
+    """Exporter: Draws the model to files in a separate process."""
+
+if 'serve' in options:
+    import live
+    server = live.LiveServer(sim, port=int(options['serve']), every=int(options.get('serve_every', 1)))
+    """LiveServer: Publishes the state of the model over HTTP and WebSocket."""
+    print('Watch the model at ' + server.url)
+
+if profile or 'profile' in options:
+    profiler = sim.profile()
+    """Profiler: Times every phase of every iteration."""
+
+for sheep in herd:
+    """Print original location of each sheep.
+
+       The __str__ class has been overridden to print the original location
        of each sheep.
-       
-    """
-    herd.append(af.Sheep(environment,herd))
-    herd[i].__str__()
-    """Print original location of each sheep."""
-
-   
-#: Make the wolves
-for j in range(num_of_wolves):
-    """Generate wolves.
-    
-    Loop through the number of wolves to be generated and add each wolf 
-    to the list of wolves. Use the Wolf class from the agentframework to 
-    create the x/y coordinates for each wolf.
-    
-    """
-    wolves.append(af.Wolf(wolves))
-
-#: Generate plot layout (figure)
-fig =plt.figure(figsize=(7, 7))
-"""Figure: Define figure size."""
-ax = fig.add_axes([0, 0, 1, 1])
-"""Axes: Define figure axes."""
-fig.patch.set_facecolor('#dedede')
-"""Set figure background color to grey."""                        
-
-                       
-def update(frame_number):
-    """Update the model"""
-    fig.clear()   
-    """Clear figure before rebuilding it."""
-    
-    for j in range(num_of_iterations):        
-        try:
-            for j in range(len(wolves)):
-                """Loop through the list of wolves."""
-                wolves[j].wolves = rnd.sample(wolves[j].wolves, k=len(wolves[j].wolves)) 
-                wolves[j].hunt_sheep()
-                """Wolf moves to hunt sheep."""
-                wolves[j].starve()
-                """If wolf is not able to catch sheep, it will starve"""
-               
-                if wolves[j].alive == False:
-                    """ remove dead wolves """
-                    wolves.pop(j)
-            
-            for i in range(len(herd)): 
-                """Loop through the sheep herd."""
-                herd[i].escape_wolves(wolves)
-                """Sheep tries to escape wolf."""
-                if herd[i].alive == False:
-                    """Remove dead sheep."""
-                    herd.pop(i)
-                else:
-                    herd[i].herd = rnd.sample(herd[i].herd, k=len(herd[i].herd)) 
-                    """reorder sheep randomly."""
-                    herd[i].move()
-                    """Sheep moves."""
-                    herd[i].eat()
-                    """Sheep eats and sickens up with overeaten."""
-                    herd[i].share_with_neighbours(neighbourhood)
-                    if herd[i].mate():
-                        """If female sheep try to mate."""
-                        herd.append(af.Sheep(environment,herd))
-                                            
-            # control sheep population 
-            if ctrl.new_wolves(): wolves.append(af.Wolf(wolves))
-            """There is a 1% chance a new wolf is introduced."""
-            ctrl.disease_outbreak(herd)
-            """ If sheep herd exceeds 100, a disease outbreak occurs. Sheep have a 20% chance of surviving the disease."""
-        except IndexError:
-            pass 
-
-    #: Map environment, sheep and wolves
-    pos = plt.imshow(environment,cmap='summer_r')
-    """Plot environment raster."""
-    plt.colorbar(pos, orientation="horizontal")
-    """Add color bar to the figure. """
-    
-    for i in range(len(herd)):
-        """Loop through the herd and plot sheep."""
-        plt.scatter(herd[i].x, herd[i].y,color ='white')
-    for j in range(len(wolves)):
-        """Loop through the wolves and plot wolves."""
-        plt.scatter(wolves[j].x, wolves[j].y, color ='red')
-   
-    #: Style plot
-    plt.scatter(102, 102,color ='white',label="Sheep #("+ str(len(herd)) +')')
-    plt.scatter(102, 102,color ='red',label="Wolf #("+ str(len(wolves)) +')')
-    """Create two fakes points outside the plot area. These points will be used for the legend."""
-
-    plt.legend(loc=9, bbox_to_anchor=(0.5, -0.1),ncol=2,frameon=False) 
-    """ Add plot legend."""
-        
-    plt.xlim(0, 99)
-    plt.ylim(0, 99)
-    """ restrict plot area to 100px """
-    
-    plt.suptitle('Sheep and Wolves', fontsize=20,color='#0d6d13')
-    plt.title('(Agent Based Model)', fontsize=12,loc='center',color='#4b4f4c')
-    """ Add plot title and subtitle """
-
 
-def gen_function(b = [0]):
-    """Define stopping point for the model.
-    
-    The animation will stop when any of the three criteria are true:
-    1. Sheep have eaten all the grass (Environment is zero).
-    2. All sheep have died.
-    3. The maximum number of iterations has been reached. 
-    
     """
-    a = 0
-    env_sum = 0
-    for i, row in enumerate(environment):
-        """Loop through the first 100  square pixels to calculate the remaining environment."""
-        env_sum +=sum(row[:100])
-        if i == 99:
-            break
-    carry_on = True if len(herd)>0 and env_sum>0 else False 
-    """Boolean: If neither conditions 1 and 2 are set carry on variable to true."""
-    while  (a < max_iterations) & (carry_on): 
-        yield a			#: Returns control and waits next call.
-        a = a + 1
+    sheep.__str__()
+original = list(herd)
+"""list: Sheep of the starting herd, in order. The simulation shuffles and compacts the herd as it runs."""
+
+if headless:
+    sim.run()
+else:
+    import renderer
+    animation = renderer.Renderer(sim).animate()
+    """Create animated plot. Continues to update the plot until stopping criteria was met."""
 
+if 'telemetry' in options:
+    recorder.close()
 
-animation = anm.FuncAnimation(fig, update, frames=gen_function, repeat=False)
-"""Create animated plot. Continues to update the plot until stopping criteria was met.""" 
+if 'export' in options:
+    exporter.close()
 
-plt.show()
-"""Display the plot."""
+if 'serve' in options:
+    server.close()
 
+if profile or 'profile' in options:
+    print(profiler.report())
+    if 'profile' in options:
+        profiler.write_trace(options['profile'])
 
+environment = sim.environment
+"""Environment: Environment raster after the run, with running row sums."""
 
 #: Write out the environment as a file.
 with open('environment_out.txt', "w") as f1,open('environment_row_sum.txt', "a")  as f2: 
     """Write the environment raster to files. 
     
     Write the raster data to a new file or overwrite the existing file if present.
-    Append the sum of each row to a second file. 
+    Append the sum of each row, tracked by the environment, to a second file. 
     
     """           
-    for line in environment:
-        f1.write(str(line)+'\n')
-        """ write the value of each pixel in a line to file."""
-        f2.write(str(sum(line))+'\n')
+    for line, row_sum in zip(environment, environment.row_sums):
+        f1.write(str([int(v) if v == int(v) else v for v in line.tolist()])+'\n')
+        """ write the value of each pixel in a line to file, whole amounts as integers like in the input raster."""
+        f2.write(str(int(row_sum) if row_sum == int(row_sum) else float(row_sum))+'\n')
         """ write sum of each line to file."""
-f1.close(), f2.close()
-"""Close both files."""
+
+if isinstance(sim, sm.VectorSimulation):
+    original = sorted((sheep for sheep in sim.herd if sheep.origin >= 0), key=lambda sheep: sheep.origin)
+    """list: Views of the sheep of the starting herd still alive, found by their position in the starting herd."""
 
 try:
-	for i in range(num_of_sheep):
+	for sheep in original:
 		""" print start and end location of each agent """
-		print('start:' + herd[i].org_location + ' end: ' + str(herd[i].y) +'/' + str(herd[i].x))
+		print('start:' + sheep.org_location + ' end: ' + str(sheep.y) +'/' + str(sheep.x))
 except:
 	pass
 
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Profiling
+
+Description: Opt-in instrumentation of the simulation step. A profiler measures the time spent in
+every phase of an iteration (wolves hunting, wolves catching sheep, moving, eating, sharing,
+mating, the population control, regrowth, the subscribers, which include telemetry and export,
+and the rendering between iterations) and counts the interaction checks of the phases that look
+for nearby agents: the candidate pairs returned by the spatial index (the distances evaluated)
+and the neighbours actually found.
+
+The simulation calls lap(phase) after each phase. By default it holds NULL, a profiler whose
+methods do nothing, so an uninstrumented run only pays for a few empty method calls per sheep.
+
+Class Profiler: Collects the time and counts of every iteration, a per-step trace and a summary.
+
+Class NullProfiler: Profiler that records nothing.
+
+"""
+
+import collections
+import csv
+import time
+
+
+class NullProfiler:
+    """Profiler that records nothing, used while profiling is disabled."""
+
+    counts = None
+    """Interaction counters. None tells the agents not to count."""
+
+    def start(self, step):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL = NullProfiler()
+"""NullProfiler: Shared instance used by every simulation that is not profiled."""
+
+
+class Profiler:
+    """Time the phases of every iteration and count interaction checks.
+
+    Time is attributed by laps: start() begins an iteration, and every call of lap(phase)
+    adds the time since the previous call to that phase. Laps after stop() are added to the
+    iteration that just ended, which is how the subscribers notified after an iteration are
+    timed. The time between the last lap of an iteration and the start of the next one is
+    added to the ended iteration as the render phase: the drawing of the plot when the model
+    is animated, only the loop overhead when it runs headless.
+
+    Arg:
+        trace (bool): Keep one record per iteration. Only the totals are kept if False.
+
+    Attributes:
+        counts (Counter): Interaction counters of the current iteration, named <phase>_checks
+        (candidate pairs from the spatial index) and <phase>_found (neighbours within range).
+        seconds (Counter): Total time per phase.
+        totals (Counter): Total of every interaction counter.
+        steps (int): Number of iterations profiled.
+        trace (list): Dictionary per iteration with the step number, the seconds per phase and the counters.
+
+    """
+
+    def __init__(self, trace=True):
+        self.keep_trace = trace
+        self.counts = collections.Counter()
+        self.seconds = collections.Counter()
+        self.totals = collections.Counter()
+        self.steps = 0
+        self.trace = []
+        self.current = {}
+        self._last = time.perf_counter()
+
+    def start(self, step):
+        """Begin the record of an iteration.
+
+        arg:
+            step (int): Number of the iteration.
+
+        """
+        if self.steps:
+            self.lap('render')
+            """The record of the ended iteration is still current, and already in the trace."""
+        else:
+            self._last = time.perf_counter()
+        self.current = {'step': step}
+        self.counts.clear()
+
+    def lap(self, phase):
+        """Add the time since the previous lap to a phase."""
+        now = time.perf_counter()
+        seconds = now - self._last
+        self.current[phase] = self.current.get(phase, 0.0) + seconds
+        self.seconds[phase] += seconds
+        self._last = now
+
+    def stop(self):
+        """End the record of an iteration and add its counters to the totals."""
+        self.current.update(self.counts)
+        self.totals.update(self.counts)
+        self.steps += 1
+        if self.keep_trace:
+            self.trace.append(self.current)
+
+    def summary(self):
+        """Summarise the profiled iterations.
+
+        return: Dictionary with the number of iterations, the total time, the time per phase
+        (total seconds, share of the total time and seconds per iteration) and the total and
+        per iteration value of every counter.
+
+        """
+        total = sum(self.seconds.values())
+        steps = max(self.steps, 1)
+        return {'steps': self.steps, 'seconds': total,
+                'phases': {phase: {'seconds': seconds, 'share': seconds / total if total else 0.0,
+                                   'per_step': seconds / steps}
+                           for phase, seconds in self.seconds.most_common()},
+                'counts': {name: {'total': value, 'per_step': value / steps}
+                           for name, value in sorted(self.totals.items())}}
+
+    def report(self):
+        """return: The summary as a text table."""
+        summary = self.summary()
+        lines = ['Profiled {} iterations, {:.3f} s'.format(summary['steps'], summary['seconds']),
+                 '{:>24} {:>12} {:>8} {:>14}'.format('phase', 'seconds', 'share', 'ms per step')]
+        for phase, row in summary['phases'].items():
+            lines.append('{:>24} {:>12.4f} {:>7.1%} {:>14.4f}'.format(phase, row['seconds'], row['share'],
+                                                                    1000 * row['per_step']))
+        lines.append('{:>30} {:>14} {:>14}'.format('counter', 'total', 'per step'))
+        for name, row in summary['counts'].items():
+            lines.append('{:>30} {:>14} {:>14.1f}'.format(name, row['total'], row['per_step']))
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        """Write the per-step trace to a CSV file, one row per iteration."""
+        columns = ['step'] + sorted({name for record in self.trace for name in record} - {'step'})
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.trace)
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Raster
+
+Description: Reads the environment raster. The comma separated text file is parsed in a single
+vectorised pass into a two dimensional integer array, which is then cached as a NumPy binary
+(.npy) file. Later runs, and every worker of a parameter sweep, memory-map the cached array
+instead of parsing the text again, so they start instantly and share the same pages in memory.
+
+The cache lives in a .raster_cache directory next to the raster file. Its file name is derived
+from the path, size and modification time of the raster, so editing the raster invalidates the
+cache automatically; the caches of earlier versions of the raster are deleted when a new one is
+written.
+
+Class Environment: Working copy of the raster used by the model. Every change made by the sheep
+goes through add() or add_at(), which also update the sum of each row and the total remaining
+environment, so both are available at any time without summing the raster again.
+
+Class TiledEnvironment: Environment for rasters larger than memory. The raster is kept in a
+memory-mapped working file and split into square tiles; only the tiles the agents touch are
+loaded, a bounded number of them is cached, and changed tiles are written back to the file when
+they are evicted or flushed. It offers the same reading and add()/add_at() interface.
+
+Function regrow: Grass regrowth applied to a whole raster (or a band of it) at once: optional
+spread of grass to the four neighbouring pixels followed by logistic growth capped at a carrying
+capacity. Both environments offer it as their regrow() method.
+
+Function as_environment: Wraps a raster in an Environment unless it already is one.
+
+Function near_zero: Compares a running total with zero. The running totals drift by rounding as
+amounts are added and removed, so both environments check a raster whose total is near zero pixel
+by pixel before reporting it exhausted.
+
+"""
+
+import collections
+import glob
+import hashlib
+import os
+import numpy as np
+
+TOLERANCE = 1e-9
+"""float: Rounding drift of a running total, relative to the amounts summed, within which it may be zero."""
+
+
+def cache_path(path):
+    """Define the location of the cached binary for a raster file.
+
+    arg:
+        path (str): Path to the environment raster file.
+
+    return: Path to the .npy cache file.
+
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = hashlib.sha1('{}:{}:{}'.format(path, stat.st_size, stat.st_mtime_ns).encode()).hexdigest()[:16]
+    return os.path.join(os.path.dirname(path), '.raster_cache', os.path.basename(path) + '.' + key + '.npy')
+
+
+def read_raster(path, dtype=np.int32):
+    """Parse a comma separated raster file into a two dimensional array in one pass.
+
+    args:
+        path (str): Path to the environment raster file.
+        dtype (type): Integer type of the array.
+
+    return: Two dimensional array. Each value represent one pixel of the environment raster.
+
+    """
+    return np.loadtxt(path, delimiter=',', dtype=dtype, ndmin=2)
+
+
+def load_raster(path, cache=True):
+    """Read the environment raster, using the binary cache if possible.
+
+    The returned array is a read-only memory map when it comes from the cache. Copy it
+    (for example with numpy.array) before modifying it.
+
+    args:
+        path (str): Path to the environment raster file.
+        cache (bool): Read and write the binary cache. If False the text file is always parsed.
+
+    return: Two dimensional integer array of the environment raster.
+
+    """
+    if not cache:
+        return read_raster(path)
+    cached = cache_path(path)
+    try:
+        return np.load(cached, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+    raster = read_raster(path)
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temporary = cached + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'wb') as file:
+            np.save(file, raster)
+        os.replace(temporary, cached)
+        """Write to a temporary file first so concurrent workers never read a partial cache."""
+    except OSError:
+        return raster
+    stale = glob.escape(os.path.join(os.path.dirname(cached), os.path.basename(path))) + '.' + '[0-9a-f]' * 16 + '.npy'
+    for old in glob.glob(stale):
+        if old != cached:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+                """Another process may be removing it too, or still be using it on a system that locks open files."""
+    return np.load(cached, mmap_mode='r')
+
+
+class Environment:
+    """Environment raster with running row sums and total.
+
+    Reading works like the nested list used before: environment[y][x] is the value of a
+    pixel and iterating over the environment yields its rows. Changes have to go through
+    add() or add_at() so the sums stay up to date.
+
+    Arg:
+        raster (array_like): Two dimensional environment raster. The environment works on a copy of floats.
+
+    Attributes:
+        raster (ndarray): Two dimensional array of floats. Each value represent one pixel of the environment raster.
+        row_sums (ndarray): Sum of each row of the raster.
+        total (float): Sum of the whole raster.
+        start_total (float): Sum of the raster when the environment was created, the scale of the rounding drift.
+        shape (tuple): Height and width of the raster.
+        height (int): Number of rows of the raster, the extent of the field along y.
+        width (int): Number of columns of the raster, the extent of the field along x.
+
+    """
+
+    def __init__(self, raster):
+        self.raster = np.array(raster, dtype=float)
+        self.row_sums = self.raster.sum(axis=1)
+        self.start_total = self.total = float(self.row_sums.sum())
+        self.height, self.width = self.shape = self.raster.shape
+
+    def __getitem__(self, y):
+        return self.raster[y]
+
+    def __len__(self):
+        return len(self.raster)
+
+    def __iter__(self):
+        return iter(self.raster)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.raster if dtype is None else self.raster.astype(dtype)
+
+    def get_at(self, y, x):
+        """return: Values of many pixels at once, given their rows y and columns x."""
+        return self.raster[y, x]
+
+    def add(self, y, x, amount):
+        """Add an amount (negative to remove) to one pixel.
+
+        args:
+            y (int): Row of the pixel.
+            x (int): Column of the pixel.
+            amount (float): Amount added to the pixel.
+
+        """
+        self.raster[y, x] += amount
+        self.row_sums[y] += amount
+        self.total += amount
+
+    def add_at(self, y, x, amounts):
+        """Add amounts to many pixels at once. Pixels may repeat.
+
+        args:
+            y (ndarray): Rows of the pixels.
+            x (ndarray): Columns of the pixels.
+            amounts (ndarray): Amount added to each pixel.
+
+        """
+        np.add.at(self.raster, (y, x), amounts)
+        self.row_sums += np.bincount(y, weights=amounts, minlength=len(self.row_sums))
+        self.total += float(np.sum(amounts))
+
+    def exhausted(self):
+        """return: True if no pixel holds any environment. Exact despite the rounding drift of the total."""
+        return near_zero(self.total, self.start_total) and not (self.raster > 0).any()
+
+    def regrow(self, rate, capacity, spread=0.0):
+        """Spread and grow the grass of the whole raster, see the regrow function, and update the sums."""
+        regrow(self.raster, rate, capacity, spread)
+        self.row_sums = self.raster.sum(axis=1)
+        self.total = float(self.row_sums.sum())
+
+    def tolist(self):
+        """return: Nested list of the raster values."""
+        return self.raster.tolist()
+
+
+class _TileRow:
+    """Row of a TiledEnvironment, so environment[y][x] reads a single pixel."""
+
+    def __init__(self, environment, y):
+        self.environment = environment
+        self.y = y
+
+    def __getitem__(self, x):
+        return self.environment.get(self.y, x)
+
+
+class TiledEnvironment:
+    """Environment raster stored in tiles of a memory-mapped working file.
+
+    The working file is a .npy file of floats. It is created from a starting raster, which
+    is copied a band of tiles at a time, or reopened if no raster is given. Tiles are read
+    from the file the first time a pixel in them is used and kept in a cache of at most
+    max_tiles tiles; the least recently used tile is dropped first, and written back if it
+    was changed. Call flush() (or close()) to write every changed tile to the file.
+
+    Reading works like Environment: environment[y][x] is the value of a pixel, iterating
+    yields its rows and numpy.asarray gives the (flushed) memory-mapped raster. Changes have
+    to go through add() or add_at() so the sums stay up to date.
+
+    Args:
+        path (str): Path of the working file.
+        raster (array_like): Two dimensional starting raster, for example the memory map returned
+        by load_raster. If None the existing working file is opened and continued.
+        tile_size (int): Side length of a tile in pixels.
+        max_tiles (int): Number of tiles kept in memory.
+
+    Attributes:
+        file (memmap): Memory map of the working file.
+        tiles (OrderedDict): Cached tiles keyed by (tile row, tile column), least recently used first.
+        dirty (set): Keys of the cached tiles changed since they were loaded.
+        row_sums (ndarray): Sum of each row of the raster.
+        total (float): Sum of the whole raster.
+        start_total (float): Sum of the raster when the environment was opened, the scale of the rounding drift.
+        shape (tuple): Height and width of the raster.
+        height (int): Number of rows of the raster, the extent of the field along y.
+        width (int): Number of columns of the raster, the extent of the field along x.
+
+    """
+
+    def __init__(self, path, raster=None, tile_size=256, max_tiles=64):
+        if raster is None:
+            self.file = np.load(path, mmap_mode='r+')
+        else:
+            self.file = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=np.shape(raster))
+            for start in range(0, self.file.shape[0], tile_size):
+                self.file[start:start + tile_size] = raster[start:start + tile_size]
+            """Copy one band of tiles at a time so the starting raster is never loaded as a whole."""
+            self.file.flush()
+        self.height, self.width = self.shape = self.file.shape
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tiles = collections.OrderedDict()
+        self.dirty = set()
+        self.row_sums = np.concatenate([self.file[start:start + tile_size].sum(axis=1)
+                                        for start in range(0, self.height, tile_size)] or [np.zeros(0)])
+        self.start_total = self.total = float(self.row_sums.sum())
+
+    def _tile(self, key):
+        """return: The cached tile with the given key, loading it (and evicting another) if needed."""
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        if len(self.tiles) >= self.max_tiles:
+            old, old_tile = self.tiles.popitem(last=False)
+            if old in self.dirty:
+                self._write(old, old_tile)
+        ts = self.tile_size
+        tile = self.tiles[key] = np.array(self.file[key[0] * ts:(key[0] + 1) * ts, key[1] * ts:(key[1] + 1) * ts])
+        return tile
+
+    def _write(self, key, tile):
+        """Write a tile back to the working file."""
+        ts = self.tile_size
+        self.file[key[0] * ts:(key[0] + 1) * ts, key[1] * ts:(key[1] + 1) * ts] = tile
+        self.dirty.discard(key)
+
+    def _groups(self, y, x):
+        """Split pixel coordinates by tile.
+
+        return: Iterator of (tile key, index of the pixels in the tile, rows in the tile, columns in the tile).
+
+        """
+        y, x = np.asarray(y, dtype=np.int64), np.asarray(x, dtype=np.int64)
+        ts = self.tile_size
+        keys = (y // ts) * ((self.width + ts - 1) // ts) + x // ts
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for index in np.split(order, bounds) if len(order) else ():
+            ty, tx = int(y[index[0]] // ts), int(x[index[0]] // ts)
+            yield (ty, tx), index, y[index] - ty * ts, x[index] - tx * ts
+
+    def __getitem__(self, y):
+        return _TileRow(self, y)
+
+    def __len__(self):
+        return self.height
+
+    def __iter__(self):
+        self.flush()
+        return iter(self.file)
+
+    def __array__(self, dtype=None, copy=None):
+        self.flush()
+        return self.file if dtype is None else self.file.astype(dtype)
+
+    def get(self, y, x):
+        """return: Value of one pixel."""
+        ts = self.tile_size
+        return self._tile((y // ts, x // ts))[y % ts, x % ts]
+
+    def get_at(self, y, x):
+        """return: Values of many pixels at once, given their rows y and columns x."""
+        values = np.empty(len(y))
+        for key, index, ty, tx in self._groups(y, x):
+            values[index] = self._tile(key)[ty, tx]
+        return values
+
+    def add(self, y, x, amount):
+        """Add an amount (negative to remove) to one pixel.
+
+        args:
+            y (int): Row of the pixel.
+            x (int): Column of the pixel.
+            amount (float): Amount added to the pixel.
+
+        """
+        ts = self.tile_size
+        key = (y // ts, x // ts)
+        self._tile(key)[y % ts, x % ts] += amount
+        self.dirty.add(key)
+        self.row_sums[y] += amount
+        self.total += amount
+
+    def add_at(self, y, x, amounts):
+        """Add amounts to many pixels at once. Pixels may repeat.
+
+        args:
+            y (ndarray): Rows of the pixels.
+            x (ndarray): Columns of the pixels.
+            amounts (ndarray): Amount added to each pixel.
+
+        """
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=float), np.shape(y))
+        for key, index, ty, tx in self._groups(y, x):
+            np.add.at(self._tile(key), (ty, tx), amounts[index])
+            self.dirty.add(key)
+        self.row_sums += np.bincount(y, weights=amounts, minlength=len(self.row_sums))
+        self.total += float(np.sum(amounts))
+
+    def flush(self):
+        """Write every changed tile back to the working file."""
+        for key in list(self.dirty):
+            self._write(key, self.tiles[key])
+        self.file.flush()
+
+    def close(self):
+        """Flush the working file and drop the cached tiles."""
+        self.flush()
+        self.tiles.clear()
+
+    def exhausted(self):
+        """return: True if no pixel holds any environment. Exact despite the rounding drift of the total.
+
+        The working file is only scanned, one band of tiles at a time, once the total is close to zero.
+
+        """
+        if not near_zero(self.total, self.start_total):
+            return False
+        self.flush()
+        return not any((self.file[start:start + self.tile_size] > 0).any()
+                       for start in range(0, self.height, self.tile_size))
+
+    def regrow(self, rate, capacity, spread=0.0):
+        """Spread and grow the grass of the whole raster, see the regrow function, and update the sums.
+
+        The working file is processed one band of tiles at a time, so only one band is held in
+        memory. The cached tiles are written back and dropped first.
+
+        """
+        self.close()
+        ts = self.tile_size
+        first, above = np.array(self.file[0]), np.array(self.file[-1])
+        for start in range(0, self.height, ts):
+            band = np.array(self.file[start:start + ts])
+            below = first if start + ts >= self.height else np.array(self.file[start + ts])
+            last = band[-1].copy()
+            regrow(band, rate, capacity, spread, above, below)
+            self.file[start:start + ts] = band
+            self.row_sums[start:start + ts] = band.sum(axis=1)
+            above = last
+            """The next band needs the original values of the last row of this one."""
+        self.file.flush()
+        self.total = float(self.row_sums.sum())
+
+    def tolist(self):
+        """return: Nested list of the raster values. Only suitable for rasters that fit in memory."""
+        self.flush()
+        return self.file.tolist()
+
+
+def near_zero(total, scale):
+    """Compare a running total with zero, allowing for its rounding drift.
+
+    args:
+        total (float): Running total of a raster.
+        scale (float): Size of the amounts that were summed, for example the starting total.
+
+    return: True if the total is within TOLERANCE * scale of zero, or below zero.
+
+    """
+    return total <= TOLERANCE * max(scale, 1.0)
+
+
+def regrow(values, rate, capacity, spread=0.0, above=None, below=None):
+    """Spread and grow the grass of a raster in place.
+
+    Every pixel first exchanges a share of its grass with its four neighbours (a diffusion
+    step that conserves the total; the field wraps around its edges like the movement of
+    the agents), then grows logistically: grass += rate * grass * (1 - grass / capacity).
+    Values are finally clipped to [0, capacity]. Empty pixels only regrow once grass
+    spreads into them.
+
+    The work is done with whole-array operations and a single temporary array, so it costs
+    a few passes over the raster per iteration whatever the number of agents.
+
+    args:
+        values (ndarray): Two dimensional raster of floats, or a band of rows of it. Leading axes hold
+        separate rasters, for example the worlds of an ensemble, each wrapping around on its own.
+        rate (float): Logistic growth rate per iteration.
+        capacity (float): Carrying capacity of a pixel.
+        spread (float): Share of the grass of a pixel exchanged with its neighbours per iteration, between 0 and 1.
+        above (ndarray): Row above the first row of the band. The last row of values if None.
+        below (ndarray): Row below the last row of the band. The first row of values if None.
+
+    """
+    work = np.empty_like(values)
+    if spread:
+        work[..., 1:, :] = values[..., :-1, :]
+        work[..., 0, :] = values[..., -1, :] if above is None else above
+        work[..., :-1, :] += values[..., 1:, :]
+        work[..., -1, :] += values[..., 0, :] if below is None else below
+        work[..., 1:] += values[..., :-1]
+        work[..., 0] += values[..., -1]
+        work[..., :-1] += values[..., 1:]
+        work[..., -1] += values[..., 0]
+        """Sum of the four neighbours of every pixel, using the original values only."""
+        work *= spread / 4
+        values *= 1 - spread
+        values += work
+    if rate:
+        np.divide(values, -capacity, out=work)
+        work += 1
+        work *= values
+        work *= rate
+        values += work
+    np.clip(values, 0, capacity, out=values)
+
+
+def as_environment(raster):
+    """return: The raster if it already is an Environment or a TiledEnvironment, else an Environment copy of it."""
+    if isinstance(raster, (Environment, TiledEnvironment)):
+        return raster
+    return Environment(raster)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Renderer
+
+Description: The renderer draws the environment, the herd of sheep and the wolves of a simulation
+using matplotlib's pyplot module. It is optional: the simulation itself does not depend on
+matplotlib, so the model can run on machines without a display.
+
+Class Renderer: Subscribes to a simulation. The image of the environment, the colour bar, one
+scatter collection for the sheep, one for the wolves and the legend are created once; after every
+model update only the raster data, the agent positions and the legend labels are replaced, and
+the animation redraws just these artists (blitting).
+
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.animation as anm
+import simulation as sm
+
+
+class Renderer:
+    """Plot the environment, sheep and wolves of a simulation.
+
+    Args:
+        simulation (Simulation): Simulation to be plotted. The renderer subscribes to it.
+
+    Attributes:
+        fig (Figure): Figure the model is drawn on.
+        ax (Axes): Figure axes.
+        image (AxesImage): Environment raster.
+        sheep (PathCollection): Scatter collection of the sheep.
+        wolves (PathCollection): Scatter collection of the wolves.
+        legend (Legend): Legend showing the number of sheep and wolves.
+
+    """
+
+    def __init__(self, simulation):
+        """Generate plot layout (figure), create the artists and subscribe to the simulation."""
+        self.simulation = simulation
+        self.fig = plt.figure(figsize=(7, 7))
+        """Figure: Define figure size."""
+        self.fig.patch.set_facecolor('#dedede')
+        """Set figure background color to grey."""
+        self.ax = self.fig.add_subplot()
+        """Axes: Define figure axes."""
+
+        raster = np.asarray(simulation.environment)
+        self.image = self.ax.imshow(raster, cmap='summer_r', vmin=0, vmax=raster.max(), animated=True)
+        """Plot environment raster. The colour range is fixed by the starting raster."""
+        self.fig.colorbar(self.image, orientation="horizontal")
+        """Add color bar to the figure. """
+
+        self.sheep = self.ax.scatter([], [], color='white', animated=True)
+        self.wolves = self.ax.scatter([], [], color='red', animated=True)
+        self.legend = self.ax.legend([self.sheep, self.wolves], ['Sheep', 'Wolf'], loc=9, ncol=2, frameon=False)
+        """ Add plot legend. It is drawn inside the axes so blitting can refresh it."""
+        self.legend.set_animated(True)
+
+        self.ax.set_xlim(0, raster.shape[1] - 1)
+        self.ax.set_ylim(0, raster.shape[0] - 1)
+        """ restrict plot area to the environment raster """
+
+        self.fig.suptitle('Sheep and Wolves', fontsize=20, color='#0d6d13')
+        self.ax.set_title('(Agent Based Model)', fontsize=12, loc='center', color='#4b4f4c')
+        """ Add plot title and subtitle """
+
+        self.artists = (self.image, self.sheep, self.wolves, self.legend)
+        """tuple: Artists redrawn every frame."""
+        simulation.subscribe(self.draw)
+        self.draw(simulation)
+
+    def draw(self, simulation):
+        """Update the environment raster, the positions of sheep and wolves and the legend.
+
+        return: The updated artists.
+
+        """
+        self.image.set_data(np.asarray(simulation.environment))
+        self.sheep.set_offsets(sm.positions(simulation.herd))
+        self.wolves.set_offsets(sm.positions(simulation.wolves))
+        labels = self.legend.get_texts()
+        labels[0].set_text("Sheep #(" + str(len(simulation.herd)) + ')')
+        labels[1].set_text("Wolf #(" + str(len(simulation.wolves)) + ')')
+        return self.artists
+
+    def frame(self, frame_number):
+        """Run one model update and return the artists to be redrawn (FuncAnimation callback)."""
+        self.simulation.update(frame_number)
+        return self.artists
+
+    def animate(self):
+        """Create animated plot and display it.
+
+        Continues to update the plot until the stopping criteria of the simulation are met.
+
+        return: The FuncAnimation object. A reference has to be kept while the plot is shown.
+
+        """
+        animation = anm.FuncAnimation(self.fig, self.frame, frames=self.simulation.frames,
+                                      init_func=lambda: self.artists, blit=True, repeat=False,
+                                      cache_frame_data=False)
+        plt.show()
+        """Display the plot."""
+        return animation
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Simulation
+
+Description: The simulation advances the herd of sheep and the wolves over the environment
+raster without drawing anything. It holds the model parameters and the populations, and
+exposes a step/update/run API so the model can be driven by an animation, by a batch job on
+a headless server or by a parameter sweep.
+
+Class Simulation: Generates the herd and the wolves and applies the rules of the agentframework
+every iteration. Renderers (or any other callable) can subscribe to the simulation and are
+called with the simulation after every model update.
+
+Class VectorSimulation: Same model running on the array backend of the arrayframework. Every
+behaviour is applied to the whole herd or pack at once, phase by phase, instead of sheep by sheep.
+
+Function set_parameters: Checks the model parameters and sets them on a simulation (or an ensemble).
+
+Function positions: Coordinates of the agents of a population of either backend, for the renderer,
+the export and the live view.
+
+Both simulations can be profiled phase by phase, see Simulation.profile and the profiling module.
+
+"""
+
+import numpy as np
+import agentframework as af
+import arrayframework as arf
+import spatialindex as si
+import profiling
+import raster
+import streams
+
+EVENTS = ('births', 'killed_by_wolves', 'died_of_disease', 'wolves_starved', 'new_wolves')
+"""tuple: Events counted during every iteration, see Simulation.events."""
+
+SHARE_MODES = ('sequential', 'batched')
+"""tuple: Ways in which sheep share their store, see Simulation."""
+
+
+def set_parameters(model, values, num_of_iterations, neighbourhood, max_iterations, regrowth, spread, capacity,
+                   share):
+    """Check the model parameters and set them as attributes of a model, see Simulation for their meaning.
+
+    args:
+        model (object): Simulation, VectorSimulation or ensemble.Ensemble being set up.
+        values (ndarray): Starting raster, whose largest value is the default capacity.
+
+    """
+    if share not in SHARE_MODES:
+        raise ValueError('share must be one of ' + ', '.join(SHARE_MODES))
+    model.num_of_iterations = num_of_iterations
+    model.neighbourhood = neighbourhood
+    model.max_iterations = max_iterations
+    model.regrowth = regrowth
+    model.spread = spread
+    model.capacity = float(np.max(values)) if capacity is None else capacity
+    model.share = share
+
+
+def positions(population):
+    """Collect the coordinates of a population.
+
+    arg:
+        population (list or Herd or Pack): Agents of the object or the array backend.
+
+    return: Array of shape (number of agents, 2) with the x and y coordinate of each agent.
+
+    """
+    if hasattr(population, 'x'):
+        return np.column_stack((population.x, population.y))
+    return np.array([(agent.x, agent.y) for agent in population], dtype=float).reshape(-1, 2)
+
+
+class Simulation:
+    """Generate the agents and advance the model.
+
+    Args:
+        environment (array_like): Environment raster. The simulation works on a raster.Environment copy of it,
+        or directly on the environment if it already is a raster.Environment or raster.TiledEnvironment.
+        num_of_sheep (int): Number of sheep at the beginning of the model.
+        num_of_wolves (int): Number of wolves at the beginning of the model.
+        num_of_iterations (int): Number of iterations after which the model will be updated.
+        neighbourhood (int): Size of the neighbourhood in which sheep can share grass.
+        max_iterations (int): Maximum number of model updates after which the model will stop.
+        regrowth (float): Logistic growth rate of the grass per iteration. No regrowth if 0.
+        spread (float): Share of the grass of a pixel spreading to its four neighbours per iteration.
+        capacity (float): Maximum amount of grass on a pixel. The largest value of the starting raster if None.
+        share (str): 'sequential' to let each sheep in turn average its store with its neighbours, or
+        'batched' to let all sheep share at once, independent of their order and conserving the
+        total store (see agentframework.share_batched).
+        seed (int): Seed of the random number streams. A (seed, parameters) pair always gives the
+        same run. Fresh entropy is used if None.
+
+    Attributes:
+        world (World): Environment, herd, wolves and random number streams shared by the agents.
+        herd (Population): Location and attributes for each sheep.
+        wolves (Population): Location and attributes for each wolf.
+        ctrl (SheepPopControl): Control mechanisms for the sheep population.
+        rng (RandomStreams): Random number streams of the sheep, the wolves, the population control
+        and the iteration order.
+        steps (int): Number of iterations run so far.
+        updates (int): Number of model updates run so far.
+        extinction_step (int): Iteration after which the herd died out. None while sheep are left.
+        events (dict): Number of births, deaths by cause and new wolves during the last iteration.
+        subscribers (list): Callables invoked with the simulation after every model update.
+        step_subscribers (list): Callables invoked with the simulation after every iteration.
+        profiler (Profiler): Times the phases of every iteration. profiling.NULL, which records nothing, unless
+        profile() was called.
+
+    """
+
+    def __init__(self, environment, num_of_sheep=10, num_of_wolves=2, num_of_iterations=10,
+                 neighbourhood=20, max_iterations=1000, regrowth=0.0, spread=0.0, capacity=None,
+                 share='sequential', seed=None):
+        """Generate the herd and the wolves."""
+        self._setup(environment, num_of_iterations, neighbourhood, max_iterations, regrowth, spread, capacity,
+                    share, seed)
+        self.world = af.World(self.environment, sheep_rng=self.rng.sheep, wolf_rng=self.rng.wolves)
+        self.herd = self.world.herd
+        self.wolves = self.world.wolves
+        self.ctrl = af.SheepPopControl(self.rng.control)
+
+        for i in range(num_of_sheep):
+            self.herd.append(af.Sheep(self.world))
+        for j in range(num_of_wolves):
+            self.wolves.append(af.Wolf(self.world))
+
+    def _setup(self, environment, num_of_iterations, neighbourhood, max_iterations, regrowth, spread, capacity,
+               share, seed):
+        """Set the parameters, random number streams and counters shared by both backends."""
+        self.environment = raster.as_environment(environment)
+        set_parameters(self, np.asarray(self.environment), num_of_iterations, neighbourhood, max_iterations,
+                       regrowth, spread, capacity, share)
+        self.rng = streams.RandomStreams(seed)
+        self.steps = 0
+        self.updates = 0
+        self.extinction_step = None
+        self.events = dict.fromkeys(EVENTS, 0)
+        self.subscribers = []
+        self.step_subscribers = []
+        self.profiler = profiling.NULL
+
+    def subscribe(self, callback, every_step=False):
+        """Register a callable to be invoked with the simulation after every model update.
+
+        args:
+            callback (callable): Function taking the simulation as its only argument.
+            every_step (bool): Invoke the callable after every iteration instead of every model update.
+
+        """
+        (self.step_subscribers if every_step else self.subscribers).append(callback)
+
+    def unsubscribe(self, callback):
+        """Stop invoking a callable registered with subscribe. Unknown callables are ignored."""
+        for subscribers in (self.subscribers, self.step_subscribers):
+            if callback in subscribers:
+                subscribers.remove(callback)
+
+    def profile(self, profiler=None):
+        """Enable profiling of every iteration.
+
+        arg:
+            profiler (Profiler): Profiler to record into. A new profiling.Profiler if None.
+
+        return: The profiler. Its summary() and trace cover the iterations run from now on.
+
+        """
+        self.profiler = profiler or profiling.Profiler()
+        self.herd.counts = self.profiler.counts
+        return self.profiler
+
+    def step(self):
+        """Run one iteration of the model.
+
+        Wolves hunt, starve and catch the weak sheep around them, then the other sheep
+        move, eat, share with their neighbours and mate. Finally the population control
+        introduces new wolves and disease outbreaks, and the grass spreads and regrows.
+        Dead agents stay in place, and lambs are queued, until the populations are
+        compacted, so every sheep gets its turn in every iteration.
+
+        The herd and the wolves are shuffled in place once per iteration. Every agent
+        holds a reference to the same list, so this one permutation defines both the
+        order in which agents act and, through the sort key of the spatial index, the
+        order in which sheep meet their neighbours, like the rank order of
+        arrayframework.Herd.share_with_neighbours.
+        With batched sharing, all sheep share at once after every sheep moved and ate.
+
+        """
+        herd, wolves = self.herd, self.wolves
+        profiler = self.profiler
+        lap = profiler.lap
+        profiler.start(self.steps)
+        batched = self.share == 'batched'
+        self.rng.order.shuffle(wolves)
+        self.rng.order.shuffle(herd)
+        """Reorder wolves and sheep randomly."""
+        sheep_grid = si.SpatialGrid(5, self.environment.width, self.environment.height, herd,
+                                    key={sheep: i for i, sheep in enumerate(herd)}.__getitem__)
+        """SpatialGrid: Index of the herd, kept up to date as sheep move and die. Queries return
+        the sheep in herd order, so sheep meet their neighbours in the order of the shuffle."""
+        lap('index')
+
+        for wolf in wolves:
+            """Loop through the list of wolves."""
+            wolf.hunt_sheep()
+            """Wolf moves to hunt sheep."""
+            wolf.starve()
+            """If wolf is not able to catch sheep, it will starve"""
+        events = self.events = dict.fromkeys(EVENTS, 0)
+        events['wolves_starved'] = wolves.compact()[0]
+        """Remove dead wolves."""
+        lap('hunt_sheep')
+
+        af.catch_sheep(wolves, sheep_grid)
+        """Wolves catch the weak sheep around them. Caught sheep leave the index."""
+        lap('catch_sheep')
+        for sheep in herd:
+            """Loop through the sheep herd."""
+            if sheep.alive == False:
+                """Dead sheep are removed from the herd at the end of the iteration."""
+                continue
+            old_x, old_y = sheep.x, sheep.y
+            sheep.move()
+            """Sheep moves."""
+            sheep_grid.move(sheep, old_x, old_y)
+            lap('move')
+            sheep.eat()
+            """Sheep eats and sickens up with overeaten."""
+            lap('eat')
+            if not batched:
+                sheep.share_with_neighbours(self.neighbourhood, sheep_grid)
+                lap('share_with_neighbours')
+            if sheep.mate(sheep_grid):
+                """If female sheep try to mate. Lambs join the herd at the end of the iteration."""
+                herd.born(af.Sheep(self.world))
+            lap('mate')
+        if batched:
+            af.share_batched(herd, self.neighbourhood, sheep_grid)
+            """All sheep share at once, after every sheep moved and ate."""
+            lap('share_with_neighbours')
+        events['killed_by_wolves'], events['births'] = herd.compact()
+        lap('compact')
+
+        # control sheep population
+        if self.ctrl.new_wolves():
+            wolves.append(af.Wolf(self.world))
+            events['new_wolves'] = 1
+        """There is a 1% chance a new wolf is introduced."""
+        self.ctrl.disease_outbreak(herd)
+        """ If sheep herd exceeds 100, a disease outbreak occurs. Sheep have a 20% chance of surviving the disease."""
+        events['died_of_disease'] = herd.compact()[0]
+        lap('population_control')
+        self.grow()
+        lap('regrowth')
+        profiler.stop()
+        self.steps += 1
+
+    def grow(self):
+        """Let the grass spread and regrow over the whole environment, if enabled."""
+        if self.regrowth or self.spread:
+            self.environment.regrow(self.regrowth, self.capacity, self.spread)
+
+    def update(self, frame_number=None):
+        """Run one model update and notify the subscribers.
+
+        A model update consists of num_of_iterations iterations. The signature matches
+        the callback expected by matplotlib's FuncAnimation.
+
+        arg:
+            frame_number (int): Frame number passed through by the animation. Not used.
+
+        """
+        for j in range(self.num_of_iterations):
+            self.step()
+            if self.extinction_step is None and len(self.herd) == 0:
+                self.extinction_step = self.steps
+            for callback in self.step_subscribers:
+                callback(self)
+            self.profiler.lap('subscribers')
+        self.updates += 1
+        for callback in self.subscribers:
+            callback(self)
+        self.profiler.lap('subscribers')
+
+    def carry_on(self):
+        """Evaluate whether the sheep can keep grazing.
+
+        The remaining environment is tracked by the Environment as the sheep eat, so the
+        check costs the same on any raster size. Only a running total close enough to zero
+        to be rounding drift makes the Environment look at the raster itself.
+
+        return: True if there are sheep left and the environment is not exhausted.
+
+        """
+        return len(self.herd) > 0 and not self.environment.exhausted()
+
+    def frames(self):
+        """Define stopping point for the model.
+
+        The model will stop when any of the three criteria are true:
+        1. Sheep have eaten all the grass (Environment is zero).
+        2. All sheep have died.
+        3. The maximum number of iterations has been reached.
+
+        The criteria are evaluated before every model update. Counting starts from the
+        model updates already run, so a simulation restored from a checkpoint stops at
+        the same point as an uninterrupted one.
+
+        """
+        a = self.updates
+        while (a < self.max_iterations) and self.carry_on():
+            yield a			#: Returns control and waits next call.
+            a = a + 1
+
+    def run(self):
+        """Run model updates until the stopping criteria are met without plotting.
+
+        return: The simulation, to allow chaining.
+
+        """
+        for frame_number in self.frames():
+            self.update(frame_number)
+        return self
+
+
+class VectorSimulation(Simulation):
+    """Advance the model with the array backend.
+
+    The herd and the wolves are stored as arrayframework.Herd and arrayframework.Pack.
+    Indexing or iterating over them returns views with the attributes of the Sheep and
+    Wolf classes, so subscribers written for Simulation keep working.
+
+    See Simulation for the arguments and attributes.
+
+    """
+
+    def __init__(self, environment, num_of_sheep=10, num_of_wolves=2, num_of_iterations=10,
+                 neighbourhood=20, max_iterations=1000, regrowth=0.0, spread=0.0, capacity=None,
+                 share='sequential', seed=None):
+        """Generate the herd and the wolves."""
+        self._setup(environment, num_of_iterations, neighbourhood, max_iterations, regrowth, spread, capacity,
+                    share, seed)
+        self.herd = arf.Herd(self.environment, num_of_sheep, self.rng.numpy('sheep'))
+        self.wolves = arf.Pack(num_of_wolves, self.rng.numpy('wolves'), *self.environment.shape)
+        self.ctrl = arf.PopControl(self.rng.numpy('control'))
+
+    def step(self):
+        """Run one iteration of the model on the whole herd and pack at once.
+
+        Wolves hunt, starve and catch the weak sheep around them, then all sheep move, eat,
+        share with their neighbours and mate. Newborn sheep join the herd right after
+        mating, before the population control, so like on the object backend lambs can
+        die in the disease outbreak of the iteration they were born in. The grass regrows
+        last.
+
+        A random permutation of the herd drawn once per iteration defines the order in
+        which sheep eat from a shared pixel and share their store.
+
+        """
+        herd, wolves = self.herd, self.wolves
+        profiler = self.profiler
+        lap = profiler.lap
+        profiler.start(self.steps)
+        events = self.events = dict.fromkeys(EVENTS, 0)
+        wolves.hunt_sheep()
+        wolves.starve()
+        events['wolves_starved'] = wolves.compact()
+        lap('hunt_sheep')
+
+        wolves.catch_sheep(herd)
+        events['killed_by_wolves'] = herd.compact()
+        lap('catch_sheep')
+        herd.move()
+        lap('move')
+        order = self.rng.numpy('order').permutation(len(herd))
+        herd.eat(order)
+        lap('eat')
+        if self.share == 'batched':
+            herd.share_batched(self.neighbourhood)
+        else:
+            herd.share_with_neighbours(self.neighbourhood, order)
+        lap('share_with_neighbours')
+        events['births'] = herd.mate()
+        herd.add(events['births'])
+        lap('mate')
+
+        if self.ctrl.new_wolves():
+            wolves.add(1)
+            events['new_wolves'] = 1
+        self.ctrl.disease_outbreak(herd)
+        events['died_of_disease'] = herd.compact()
+        lap('population_control')
+        self.grow()
+        lap('regrowth')
+        profiler.stop()
+        self.steps += 1
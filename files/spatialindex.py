@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Spatial Index
+
+Description: Uniform grid (cell list) over the field used to find the agents close to a location
+without scanning the whole population. The field is split into square cells; every agent is
+filed under the cell containing its coordinates, so a query only has to look at the cells
+overlapping the search radius.
+
+Distances in the model are measured on the plain x/y coordinates (they do not wrap around the
+edges of the field even though movement does), so queries do not wrap either.
+
+Only occupied cells are stored, so memory and rebuild time depend on the number of agents and
+not on the size of the field.
+
+Class SpatialGrid: Grid of agent objects (Sheep or Wolf) supporting insertion, removal and
+incremental updates when an agent moves. Used by the object backend.
+
+Function candidate_pairs: Array version of the grid used by the array backend. Returns every
+pair of agents from two coordinate arrays that may lie within a radius of each other.
+
+"""
+
+import math
+import numpy as np
+
+
+class SpatialGrid:
+    """File agents under the grid cell containing their coordinates.
+
+    Args:
+        cell_size (float): Side length of a grid cell.
+        width (int): Width of the field.
+        height (int): Height of the field.
+        agents (iterable): Agents to insert. Each agent needs x and y attributes.
+        key (callable): Sort key of the agents, for example their position in the herd. If given, queries
+        return their candidates sorted by it instead of in the order of the cells, so order dependent
+        callers get the same result as when scanning the whole population.
+
+    Attributes:
+        cells (dict): List of agents per occupied cell, keyed by (row, column).
+
+    """
+
+    def __init__(self, cell_size=5, width=100, height=100, agents=(), key=None):
+        self.cell_size = cell_size
+        self.key = key
+        self.cols = max(1, math.ceil(width / cell_size))
+        self.rows = max(1, math.ceil(height / cell_size))
+        self.rebuild(agents)
+
+    def _cell(self, x, y):
+        """return: (row, column) of the cell containing the coordinates, clamped to the grid."""
+        return (min(max(int(y // self.cell_size), 0), self.rows - 1),
+                min(max(int(x // self.cell_size), 0), self.cols - 1))
+
+    def rebuild(self, agents):
+        """Empty the grid and insert all agents."""
+        self.cells = {}
+        for agent in agents:
+            self.insert(agent)
+
+    def insert(self, agent):
+        """Add an agent at its current location."""
+        self.cells.setdefault(self._cell(agent.x, agent.y), []).append(agent)
+
+    def remove(self, agent, x=None, y=None):
+        """Remove an agent filed at its current location, or at (x, y) if given."""
+        cell = self._cell(agent.x if x is None else x, agent.y if y is None else y)
+        agents = self.cells[cell]
+        agents.remove(agent)
+        if not agents:
+            del self.cells[cell]
+
+    def move(self, agent, old_x, old_y):
+        """Refile an agent that moved from (old_x, old_y) to its current location."""
+        if self._cell(old_x, old_y) != self._cell(agent.x, agent.y):
+            self.remove(agent, old_x, old_y)
+            self.insert(agent)
+
+    def query(self, x, y, radius):
+        """Find the agents that may lie within a radius of a location.
+
+        Returns every agent in the cells overlapping the square of side 2 * radius centred
+        on the location. Callers apply the exact distance test.
+
+        args:
+            x (float): x coordinate of the location.
+            y (float): y coordinate of the location.
+            radius (float): Search radius.
+
+        return: List of candidate agents, sorted by key if the grid has one.
+
+        """
+        cs = self.cell_size
+        col_min, col_max = max(int((x - radius) // cs), 0), min(int((x + radius) // cs), self.cols - 1)
+        row_min, row_max = max(int((y - radius) // cs), 0), min(int((y + radius) // cs), self.rows - 1)
+        found = []
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                found.extend(self.cells.get((row, col), ()))
+        if self.key is not None:
+            found.sort(key=self.key)
+        return found
+
+
+def candidate_pairs(ax, ay, bx, by, radius, width=100, height=100):
+    """Find the pairs of agents that may lie within a radius of each other.
+
+    The agents of the second set are sorted by grid cell (cell size = radius) and every
+    agent of the first set is paired with the agents of the 3x3 block of cells around it,
+    found by binary search in the sorted cells.
+    Callers apply the exact distance test. If both sets are the same population the pairs
+    include every agent paired with itself.
+
+    args:
+        ax, ay (ndarray): Coordinates of the first set of agents.
+        bx, by (ndarray): Coordinates of the second set of agents.
+        radius (float): Search radius.
+        width (int): Width of the field.
+        height (int): Height of the field.
+
+    return: Two integer arrays i and j; agent i of the first set may be within the radius of agent j of the second set.
+
+    """
+    cs = max(float(radius), 1.0)
+    cols, rows = max(1, math.ceil(width / cs)), max(1, math.ceil(height / cs))
+    b_col = np.clip((bx // cs).astype(np.int64), 0, cols - 1)
+    b_row = np.clip((by // cs).astype(np.int64), 0, rows - 1)
+    b_cell = b_row * cols + b_col
+    order = np.argsort(b_cell, kind='stable')
+    b_cell = b_cell[order]
+
+    a_col = np.clip((ax // cs).astype(np.int64), 0, cols - 1)
+    a_row = np.clip((ay // cs).astype(np.int64), 0, rows - 1)
+    a_cell = a_row * cols + a_col
+    by_cell = np.argsort(a_cell, kind='stable')
+    """Searching the cells in increasing order is several times faster on large populations."""
+    left, right = np.empty(len(a_cell), dtype=np.int64), np.empty(len(a_cell), dtype=np.int64)
+    pairs_i, pairs_j = [], []
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            row, col = a_row + d_row, a_col + d_col
+            valid = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+            searched = by_cell[valid[by_cell]]
+            cell = a_cell[searched] + (d_row * cols + d_col)
+            left[searched] = np.searchsorted(b_cell, cell, 'left')
+            right[searched] = np.searchsorted(b_cell, cell, 'right')
+            inside = np.flatnonzero(valid)
+            start = left[inside]
+            n = right[inside] - start
+            i = np.repeat(inside, n)
+            offset = np.arange(len(i)) - np.repeat(np.cumsum(n) - n, n)
+            pairs_i.append(i)
+            pairs_j.append(order[np.repeat(start, n) + offset])
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Random Streams
+
+Description: Deterministic random number streams for the model. A single seed is expanded with
+NumPy's SeedSequence into one independent stream per subsystem of the model, so the sheep, the
+wolves, the population control and the iteration order never share (and never disturb) each
+other's random numbers. The same seed and parameters therefore always give the same run, no
+matter how many other runs are executed in the same or in other processes.
+
+Class RandomStreams: Holds one random.Random (object backend) and one numpy Generator (array
+backend) per subsystem, and spawns independent child streams, for example one per worker of a
+parameter sweep.
+
+"""
+
+import random
+import numpy as np
+
+
+class RandomStreams:
+    """Independent random number streams per subsystem derived from one seed.
+
+    Args:
+        seed (int or SeedSequence): Seed of the streams. Fresh entropy is used if None.
+
+    Attributes:
+        seed_sequence (SeedSequence): Root of the streams.
+        sheep, wolves, control, order (Random): Python random streams used by the Sheep,
+        the Wolf, the SheepPopControl classes and the iteration order of the simulation.
+
+    """
+
+    subsystems = ('sheep', 'wolves', 'control', 'order')
+    """tuple: Names of the subsystems, in the order their streams are spawned."""
+
+    def __init__(self, seed=None):
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._generators = {}
+        for name, child in zip(self.subsystems, self.seed_sequence.spawn(len(self.subsystems))):
+            setattr(self, name, random.Random(int(child.generate_state(1, np.uint64)[0])))
+            self._generators[name] = np.random.default_rng(child)
+
+    def numpy(self, name):
+        """return: NumPy random generator of a subsystem, used by the array backend."""
+        return self._generators[name]
+
+    def spawn(self, n):
+        """Create independent child streams, for example one per worker process.
+
+        arg:
+            n (int): Number of children.
+
+        return: List of RandomStreams.
+
+        """
+        return [RandomStreams(child) for child in self.seed_sequence.spawn(n)]
+
+    def getstate(self):
+        """Capture the state of every stream.
+
+        return: Dictionary of plain Python values (JSON serialisable) accepted by setstate.
+
+        """
+        python = {}
+        for name in self.subsystems:
+            version, internal, gauss = getattr(self, name).getstate()
+            python[name] = [version, list(internal), gauss]
+        seed_sequence = self.seed_sequence
+        return {'seed_sequence': {'entropy': seed_sequence.entropy,
+                                  'spawn_key': list(seed_sequence.spawn_key),
+                                  'n_children_spawned': seed_sequence.n_children_spawned},
+                'python': python,
+                'numpy': {name: self._generators[name].bit_generator.state for name in self.subsystems}}
+
+    def setstate(self, state):
+        """Restore the state of every stream captured by getstate.
+
+        arg:
+            state (dict): State returned by getstate.
+
+        """
+        seed = state['seed_sequence']
+        self.seed_sequence = np.random.SeedSequence(seed['entropy'], spawn_key=tuple(seed['spawn_key']),
+                                                    n_children_spawned=seed['n_children_spawned'])
+        for name in self.subsystems:
+            version, internal, gauss = state['python'][name]
+            getattr(self, name).setstate((version, tuple(internal), gauss))
+            self._generators[name].bit_generator.state = state['numpy'][name]
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Parameter Sweep
+
+Description: Runs the model for every combination of a grid of parameter values, several times
+per combination (replicates with different seeds), across a pool of worker processes. Each run
+is headless; only a summary of the run is sent back and collected into a single results table.
+
+Every worker reads the starting environment raster once from the raster cache. The cache is a
+memory-mapped file, so all workers share the same read-only pages and copy the raster only
+when a run starts modifying it.
+
+Summary metrics of each run:
+
+	herd (int): Number of sheep at the end of the run.
+	wolves (int): Number of wolves at the end of the run.
+	grass (float): Remaining environment at the end of the run.
+	steps (int): Number of iterations run.
+	extinction_step (int): Iteration after which the herd died out, empty if sheep survived.
+
+The sweep can be run from the command line with one name=values argument per parameter,
+values separated by commas, for example:
+
+	python sweep.py num_of_sheep=10,50,100 num_of_wolves=2,5 replicates=20 processes=8 out=results.csv
+
+With the ensemble flag, the replicates of every combination run together in one worker as an
+ensemble.Ensemble on the array backend, which is much faster for many replicates of small
+worlds. Every run gives the same herd, wolves, steps and extinction step as with the
+vectorized flag, and the same grass up to rounding in the last digits.
+
+"""
+
+import csv
+import itertools
+import os
+import sys
+import multiprocessing as mp
+import ensemble as en
+import raster
+import simulation as sm
+
+RASTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "in.txt")
+"""str: Default environment raster."""
+
+PARAMETERS = ('num_of_sheep', 'num_of_wolves', 'num_of_iterations', 'neighbourhood', 'max_iterations',
+              'regrowth', 'spread', 'capacity', 'share')
+"""tuple: Model parameters that can be swept."""
+
+TYPES = {'regrowth': float, 'spread': float, 'capacity': float, 'share': str}
+"""dict: Type of the swept parameters that are not integers."""
+
+_raster = None
+"""ndarray: Starting raster of the worker process, set by _init_worker."""
+
+
+def _init_worker(path):
+    """Memory-map the starting raster once per worker process."""
+    global _raster
+    _raster = raster.load_raster(path)
+
+
+def run_one(run):
+    """Run the model once and summarise the run.
+
+    arg:
+        run (dict): Model parameters plus seed (int) and vectorized (bool).
+
+    return: The run dictionary extended with the summary metrics.
+
+    """
+    parameters = {name: run[name] for name in PARAMETERS if name in run}
+    if run.get('vectorized'):
+        sim = sm.VectorSimulation(_raster, seed=run['seed'], **parameters)
+    else:
+        sim = sm.Simulation(_raster, seed=run['seed'], **parameters)
+    sim.run()
+    return dict(run, herd=len(sim.herd), wolves=len(sim.wolves), grass=sim.environment.total,
+                steps=sim.steps, extinction_step=sim.extinction_step)
+
+
+def run_ensemble(batch):
+    """Run the replicates of one combination of parameter values together and summarise every run.
+
+    arg:
+        batch (list): Run dictionaries differing only by their replicate and seed.
+
+    return: The run dictionaries extended with the summary metrics, like run_one.
+
+    """
+    parameters = {name: batch[0][name] for name in PARAMETERS if name in batch[0]}
+    ensemble = en.Ensemble(_raster, len(batch), seed=[run['seed'] for run in batch], **parameters).run()
+    return [dict(run, herd=int(ensemble.state['sheep'][r]), wolves=int(ensemble.state['wolves'][r]),
+                 grass=float(ensemble.state['grass'][r]), steps=int(ensemble.steps[r]),
+                 extinction_step=int(ensemble.extinction_step[r]) if ensemble.extinction_step[r] >= 0 else None)
+            for r, run in enumerate(batch)]
+
+
+def runs(grid, replicates=1, seed=0, vectorized=False):
+    """List every run of a sweep.
+
+    args:
+        grid (dict): Parameter name to list of values. Missing parameters keep the model defaults.
+        replicates (int): Number of runs per combination of parameter values.
+        seed (int): Seed of the first run. Runs are numbered and seeded consecutively.
+        vectorized (bool): Run the model on the array backend.
+
+    return: List of run dictionaries.
+
+    """
+    names = sorted(grid)
+    combinations = itertools.product(*(grid[name] for name in names))
+    todo = []
+    for values in combinations:
+        for replicate in range(replicates):
+            todo.append(dict(zip(names, values), replicate=replicate,
+                             seed=seed + len(todo), vectorized=vectorized))
+    return todo
+
+
+def sweep(grid, replicates=1, seed=0, vectorized=False, processes=None, path=RASTER_PATH, ensemble=False):
+    """Run every combination of parameter values across a pool of processes.
+
+    args:
+        grid (dict): Parameter name to list of values.
+        replicates (int): Number of runs per combination of parameter values.
+        seed (int): Seed of the first run.
+        vectorized (bool): Run the model on the array backend.
+        processes (int): Number of worker processes. Defaults to the number of cores.
+        path (str): Path to the environment raster file.
+        ensemble (bool): Run the replicates of every combination together as one ensemble.Ensemble.
+
+    return: List of result dictionaries, one per run, in run order.
+
+    """
+    raster.load_raster(path)
+    """Create the raster cache before the workers start so they all map the same file."""
+    todo = runs(grid, replicates, seed, vectorized or ensemble)
+    with mp.Pool(processes, initializer=_init_worker, initargs=(path,)) as pool:
+        if ensemble:
+            batches = [todo[start:start + replicates] for start in range(0, len(todo), replicates)]
+            results = [result for batch in pool.map(run_ensemble, batches) for result in batch]
+        else:
+            results = pool.map(run_one, todo, chunksize=max(1, len(todo) // (4 * (processes or os.cpu_count()))))
+    return results
+
+
+def write_results(results, path):
+    """Write the results table to a comma separated file.
+
+    args:
+        results (list): Result dictionaries returned by sweep.
+        path (str): Path to the output file.
+
+    """
+    columns = list(results[0]) if results else []
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == '__main__':
+    grid, options = {}, {'replicates': '1', 'seed': '0', 'processes': '', 'out': 'sweep_results.csv'}
+    for argument in sys.argv[1:]:
+        if argument in ('vectorized', 'ensemble'):
+            options[argument] = True
+            continue
+        name, _, values = argument.partition('=')
+        if name in PARAMETERS:
+            grid[name] = [TYPES.get(name, int)(value) for value in values.split(',')]
+        elif name in options:
+            options[name] = values
+        else:
+            print('Unknown argument ' + argument + '\nParameters: ' + ', '.join(PARAMETERS) +
+                  '\nOptions: replicates, seed, processes, out, vectorized, ensemble')
+            sys.exit(1)
+
+    results = sweep(grid, replicates=int(options['replicates']), seed=int(options['seed']),
+                    vectorized=options.get('vectorized', False), ensemble=options.get('ensemble', False),
+                    processes=int(options['processes']) if options['processes'] else None)
+    write_results(results, options['out'])
+    print('Wrote ' + str(len(results)) + ' runs to ' + options['out'])
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Telemetry
+
+Description: Streams per-iteration measurements of a simulation to disk in a columnar binary
+format, so long runs can be analysed without keeping their history in memory or parsing text
+dumps.
+
+A recording is a directory holding one table per kind of record. Every column of a table is a
+separate raw binary file (<table>.<column>.bin) of a fixed NumPy type, described by schema.json.
+Rows are buffered in memory and appended to the column files in chunks. Columns can be read back
+with read_table, which memory-maps the files, so only the data actually used is loaded.
+
+Tables:
+
+	steps: step, herd, wolves, grass and the events of the iteration (births, killed_by_wolves,
+	died_of_disease, wolves_starved, new_wolves).
+	sheep: step, x, y, store and female for every sheep (optional snapshots).
+	wolves: step, x, y and starving for every wolf (optional snapshots).
+
+Class Table: Buffered, append-only columnar table.
+
+Class Recorder: Subscribes to a simulation and writes its tables after every iteration.
+
+"""
+
+import json
+import os
+import numpy as np
+import simulation as sm
+
+STEP_COLUMNS = dict([('step', 'int64'), ('herd', 'int64'), ('wolves', 'int64'), ('grass', 'float64')] +
+                    [(event, 'int64') for event in sm.EVENTS])
+"""dict: Columns and types of the steps table."""
+
+SHEEP_COLUMNS = {'step': 'int64', 'x': 'float64', 'y': 'float64', 'store': 'float64', 'female': 'bool'}
+"""dict: Columns and types of the sheep snapshot table."""
+
+WOLF_COLUMNS = {'step': 'int64', 'x': 'float64', 'y': 'float64', 'starving': 'int64'}
+"""dict: Columns and types of the wolf snapshot table."""
+
+
+class Table:
+    """Append-only table stored as one binary file per column.
+
+    Args:
+        directory (str): Directory of the recording.
+        name (str): Name of the table.
+        columns (dict): Column name to NumPy type name.
+        chunk_size (int): Number of rows buffered before they are written.
+
+    """
+
+    def __init__(self, directory, name, columns, chunk_size=4096):
+        self.directory = directory
+        self.name = name
+        self.columns = {column: np.dtype(dtype) for column, dtype in columns.items()}
+        self.chunk_size = chunk_size
+        self.buffers = {column: [] for column in columns}
+        self.buffered = 0
+        for column in columns:
+            open(self.path(column), 'wb').close()
+
+    def path(self, column):
+        """return: Path of the file of a column."""
+        return os.path.join(self.directory, self.name + '.' + column + '.bin')
+
+    def append(self, **values):
+        """Add rows. Every column receives a scalar (one row) or an array of equal length."""
+        n = 1
+        for column, value in values.items():
+            value = np.atleast_1d(np.asarray(value, dtype=self.columns[column]))
+            self.buffers[column].append(value)
+            n = len(value)
+        self.buffered += n
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the column files."""
+        if not self.buffered:
+            return
+        for column, parts in self.buffers.items():
+            with open(self.path(column), 'ab') as file:
+                np.concatenate(parts).tofile(file)
+            parts.clear()
+        self.buffered = 0
+
+
+class Recorder:
+    """Record a simulation after every iteration.
+
+    Args:
+        simulation (Simulation): Simulation to be recorded. The recorder subscribes to it.
+        directory (str): Directory of the recording. Created if missing.
+        snapshot_every (int): Write the position and attributes of every agent each snapshot_every
+        iterations. No snapshots are written if 0.
+        chunk_size (int): Number of rows buffered per table before they are written.
+
+    Attributes:
+        tables (dict): Table name to Table.
+
+    """
+
+    def __init__(self, simulation, directory, snapshot_every=0, chunk_size=4096):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        schema = {'steps': STEP_COLUMNS}
+        if snapshot_every:
+            schema.update(sheep=SHEEP_COLUMNS, wolves=WOLF_COLUMNS)
+        with open(os.path.join(directory, 'schema.json'), 'w') as file:
+            json.dump(schema, file, indent=1)
+        self.tables = {name: Table(directory, name, columns, chunk_size) for name, columns in schema.items()}
+        simulation.subscribe(self.record, every_step=True)
+
+    def record(self, simulation):
+        """Append the state of the simulation after an iteration."""
+        step = simulation.steps
+        self.tables['steps'].append(step=step, herd=len(simulation.herd), wolves=len(simulation.wolves),
+                                    grass=simulation.environment.total, **simulation.events)
+        if self.snapshot_every and step % self.snapshot_every == 0:
+            herd, wolves = simulation.herd, simulation.wolves
+            if hasattr(herd, 'store'):
+                sheep = dict(x=herd.x, y=herd.y, store=herd.store, female=herd.female)
+                wolf = dict(x=wolves.x, y=wolves.y, starving=wolves.starving)
+            else:
+                sheep = dict(x=[s.x for s in herd], y=[s.y for s in herd], store=[s.store for s in herd],
+                             female=[s.sex == 'f' for s in herd])
+                wolf = dict(x=[w.x for w in wolves], y=[w.y for w in wolves], starving=[w.starving for w in wolves])
+            self.tables['sheep'].append(step=np.full(len(herd), step), **sheep)
+            self.tables['wolves'].append(step=np.full(len(wolves), step), **wolf)
+
+    def close(self):
+        """Write all buffered rows."""
+        for table in self.tables.values():
+            table.flush()
+
+
+def read_table(directory, name):
+    """Read a table of a recording.
+
+    args:
+        directory (str): Directory of the recording.
+        name (str): Name of the table.
+
+    return: Dictionary of column name to memory-mapped array.
+
+    """
+    with open(os.path.join(directory, 'schema.json')) as file:
+        columns = json.load(file)[name]
+    table = {}
+    for column, dtype in columns.items():
+        path = os.path.join(directory, name + '.' + column + '.bin')
+        table[column] = np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.empty(0, dtype)
+    return table
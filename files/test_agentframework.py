@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Agent framework tests
+
+Description: Sharing gives the same stores whether sheep look up their neighbours in the spatial
+index or in the whole herd, batched sharing conserves the total store in any order, and a sheep
+in reach of several wolves is caught by the nearest one.
+
+"""
+
+import numpy as np
+import pytest
+import agentframework as af
+import simulation as sm
+import spatialindex as si
+
+SHEEP = ((10, 10, 0.0), (30, 30, 90.0), (20, 20, 50.0))
+"""tuple: x, y and store of a weak sheep, a slow sheep and a sheep strong enough to escape."""
+
+WOLVES = ((12, 10), (11, 10), (31, 30), (29, 30), (21, 20))
+"""tuple: x and y of two wolves at different distances from the weak sheep, two wolves as close
+to the slow sheep and one wolf next to the strong sheep."""
+
+
+def grazed_herd(field, num_of_sheep=30):
+    """return: Herd of a fresh object backend simulation, with a different store for every sheep.
+    Sheep share with the sheep of this list, in its order."""
+    herd = sm.Simulation(field, num_of_sheep=num_of_sheep, num_of_wolves=0, seed=1).herd
+    for sheep, store in zip(herd, np.linspace(0, 90, len(herd))):
+        sheep.store = store
+    return herd
+
+
+def test_grid_share_matches_whole_herd(field):
+    herd = grazed_herd(field)
+    before = [sheep.store for sheep in herd]
+    for sheep in herd:
+        sheep.share_with_neighbours(20)
+    scanned = [sheep.store for sheep in herd]
+    for sheep, store in zip(herd, before):
+        sheep.store = store
+    grid = si.SpatialGrid(5, 40, 40, herd, key={sheep: i for i, sheep in enumerate(herd)}.__getitem__)
+    for sheep in herd:
+        sheep.share_with_neighbours(20, grid)
+    assert [sheep.store for sheep in herd] == scanned
+    assert scanned != before
+
+
+def test_batched_share_conserves_the_store_in_any_order(field):
+    herd = grazed_herd(field)
+    before = [sheep.store for sheep in herd]
+    af.share_batched(herd, 20)
+    forward = [sheep.store for sheep in herd]
+    for sheep, store in zip(herd, before):
+        sheep.store = store
+    af.share_batched(herd[::-1], 20)
+    assert [sheep.store for sheep in herd] == pytest.approx(forward, abs=1e-12)
+    assert sum(forward) == pytest.approx(sum(before))
+    assert forward != before
+
+
+def test_nearest_wolf_catches_the_sheep(field):
+    simulation = sm.Simulation(field, num_of_sheep=len(SHEEP), num_of_wolves=len(WOLVES), seed=1)
+    herd, wolves = simulation.herd, simulation.wolves
+    for sheep, (x, y, store) in zip(herd, SHEEP):
+        sheep.x, sheep.y, sheep.store = x, y, store
+    for wolf, (x, y) in zip(wolves, WOLVES):
+        wolf.x, wolf.y, wolf.starving = x, y, 50
+    assert af.catch_sheep(wolves, si.SpatialGrid(5, 40, 40, herd)) == 2
+    assert [sheep.alive for sheep in herd] == [False, False, True]
+    assert [wolf.starving for wolf in wolves] == [50, 0, 0, 50, 50]
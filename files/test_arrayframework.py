@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Array framework tests
+
+Description: The array backend shares like the object backend, batched sharing conserves the total
+store in any order, the nearest wolf catches a sheep, and the herd keeps track of the sheep of the
+starting herd.
+
+"""
+
+import numpy as np
+import pytest
+import simulation as sm
+from test_agentframework import SHEEP, WOLVES, grazed_herd
+
+
+def test_share_matches_object_backend(field):
+    herd = grazed_herd(field)
+    vector = sm.VectorSimulation(field, num_of_sheep=len(herd), num_of_wolves=0, seed=1).herd
+    vector.x = np.array([sheep.x for sheep in herd])
+    vector.y = np.array([sheep.y for sheep in herd])
+    vector.store = np.array([sheep.store for sheep in herd])
+    order = np.random.default_rng(2).permutation(len(herd))
+    herd[:] = [herd[i] for i in order]
+    """The object backend shares in herd order, shuffled in place like in Simulation.step."""
+    for sheep in herd:
+        sheep.share_with_neighbours(20)
+    vector.share_with_neighbours(20, order)
+    np.testing.assert_allclose(vector.store[order], [sheep.store for sheep in herd], rtol=1e-14)
+    assert not np.allclose(vector.store, np.linspace(0, 90, len(herd)))
+
+
+def test_origin_follows_the_starting_herd(field):
+    simulation = sm.VectorSimulation(field, num_of_sheep=15, num_of_wolves=2, num_of_iterations=5,
+                                     max_iterations=4, seed=3)
+    start = np.column_stack((simulation.herd.y, simulation.herd.x))
+    herd = simulation.run().herd
+    original = herd.origin >= 0
+    np.testing.assert_array_equal(np.column_stack((herd.org_y, herd.org_x))[original], start[herd.origin[original]])
+    assert len(np.unique(herd.origin[original])) == original.sum()
+
+
+def test_batched_share_conserves_the_store_in_any_order(field):
+    herd = sm.VectorSimulation(field, num_of_sheep=30, num_of_wolves=0, seed=1).herd
+    herd.store = np.linspace(0, 90, len(herd))
+    before = herd.store.copy()
+    order = np.random.default_rng(3).permutation(len(herd))
+    columns = {name: getattr(herd, name).copy() for name, dtype in herd.fields}
+    herd.share_batched(20)
+    forward = herd.store.copy()
+    for name, column in columns.items():
+        setattr(herd, name, column[order])
+    herd.share_batched(20)
+    np.testing.assert_allclose(herd.store, forward[order], atol=1e-12)
+    assert forward.sum() == pytest.approx(before.sum())
+    assert not np.array_equal(forward, before)
+
+
+def test_nearest_wolf_catches_the_sheep(field):
+    simulation = sm.VectorSimulation(field, num_of_sheep=len(SHEEP), num_of_wolves=len(WOLVES), seed=1)
+    herd, wolves = simulation.herd, simulation.wolves
+    herd.x, herd.y, herd.store = (np.array(column) for column in zip(*SHEEP))
+    wolves.x, wolves.y = (np.array(column, dtype=float) for column in zip(*WOLVES))
+    wolves.starving = np.full(len(WOLVES), 50)
+    assert wolves.catch_sheep(herd) == 2
+    assert herd.alive.tolist() == [False, False, True]
+    assert wolves.starving.tolist() == [50, 0, 0, 50, 50]
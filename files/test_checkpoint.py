@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Checkpoint tests
+
+Description: A simulation restored from a checkpoint, in memory or into a tiled environment,
+continues like an uninterrupted one.
+
+"""
+
+import pytest
+import checkpoint
+import raster
+from conftest import BACKENDS
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_resume_continues_like_an_uninterrupted_run(backend, field, same_run, tmp_path):
+    parameters = dict(num_of_sheep=15, num_of_wolves=2, num_of_iterations=5, regrowth=0.5, seed=7)
+    uninterrupted = backend(field, max_iterations=8, **parameters).run()
+    path = str(tmp_path / 'checkpoint.npz')
+    checkpoint.save(backend(field, max_iterations=3, **parameters).run(), path)
+    resumed = checkpoint.load(path, max_iterations=8).run()
+    assert isinstance(resumed, backend)
+    same_run(uninterrupted, resumed)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_resume_into_a_tiled_environment(backend, field, same_run, tmp_path):
+    parameters = dict(num_of_sheep=15, num_of_wolves=2, num_of_iterations=5, seed=5)
+    path = str(tmp_path / 'checkpoint.npz')
+    checkpoint.save(backend(field, max_iterations=3, **parameters).run(), path)
+    in_memory = checkpoint.load(path, max_iterations=6).run()
+    tiled = checkpoint.load(path, tiled=str(tmp_path / 'working.npy'), max_iterations=6)
+    assert isinstance(tiled.environment, raster.TiledEnvironment)
+    same_run(in_memory, tiled.run())
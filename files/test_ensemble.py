@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Ensemble tests
+
+Description: Every world of an ensemble follows the same run as a VectorSimulation with its seed.
+
+"""
+
+import numpy as np
+import pytest
+import ensemble
+import simulation as sm
+
+
+def test_worlds_follow_vector_simulation(field):
+    parameters = dict(num_of_sheep=15, num_of_wolves=2, num_of_iterations=5, max_iterations=8, seed=4)
+    worlds = ensemble.Ensemble(field, 3, **parameters).run()
+    parameters.pop('seed')
+    for r, seed in enumerate(worlds.seeds):
+        single = sm.VectorSimulation(field, seed=seed, **parameters).run()
+        assert worlds.steps[r] == single.steps
+        assert worlds.state['sheep'][r] == len(single.herd)
+        assert worlds.state['wolves'][r] == len(single.wolves)
+        assert worlds.state['grass'][r] == pytest.approx(single.environment.total)
+        rows = slice(r * worlds.stride, r * worlds.stride + worlds.height)
+        np.testing.assert_array_equal(np.asarray(worlds.environment)[rows], np.asarray(single.environment))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Live view tests
+
+Description: The downsampled raster keeps every side of a long and narrow raster, and a closed
+server no longer takes part in the model updates.
+
+"""
+
+import numpy as np
+import live
+import simulation as sm
+
+
+def test_downsample_keeps_narrow_sides():
+    assert live.downsample(np.ones((1000, 10)), 64).shape == (62, 10)
+    assert live.downsample(np.ones((10, 1000)), 64).shape == (10, 62)
+    assert live.downsample(np.ones((300, 300)), 64).shape == (60, 60)
+
+
+def test_closed_server_stops_publishing():
+    simulation = sm.VectorSimulation(np.full((1000, 10), 50.0), num_of_sheep=5, num_of_wolves=1, seed=1)
+    with live.LiveServer(simulation) as server:
+        simulation.update(0)
+        assert server.published == 1
+    simulation.update(1)
+    assert server.published == 1
+    assert not simulation.subscribers
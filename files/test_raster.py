@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Title: Agent based model - Raster tests
+
+Description: The binary cache keeps only the version of the raster last read, and a tiled
+environment gives the same run as one in memory.
+
+"""
+
+import os
+import pytest
+import raster
+from conftest import BACKENDS
+
+
+def test_cache_keeps_only_the_current_version(tmp_path):
+    path = str(tmp_path / 'in.txt')
+    (tmp_path / 'in.txt.old').write_text('7,7\n')
+    raster.load_raster(path + '.old')
+    for version in range(3):
+        with open(path, 'w') as file:
+            file.write('{},2\n3,4\n'.format(version))
+        os.utime(path, ns=(version * 10 ** 9, version * 10 ** 9))
+        assert raster.load_raster(path)[0, 0] == version
+    cached = sorted(os.listdir(str(tmp_path / '.raster_cache')))
+    assert cached == sorted([os.path.basename(raster.cache_path(path)), os.path.basename(raster.cache_path(path + '.old'))])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_tiled_environment_gives_the_same_run(backend, field, same_run, tmp_path):
+    parameters = dict(num_of_sheep=15, num_of_wolves=2, num_of_iterations=5, max_iterations=6, seed=2)
+    in_memory = backend(field, **parameters).run()
+    tiled = raster.TiledEnvironment(str(tmp_path / 'working.npy'), field, tile_size=16, max_tiles=4)
+    same_run(in_memory, backend(tiled, **parameters).run())
+    assert tiled.total == pytest.approx(in_memory.environment.total)